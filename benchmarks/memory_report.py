@@ -0,0 +1,44 @@
+"""
+每个节点占用的内存
+
+python benchmarks/memory_report.py [节点数量]
+
+分别统计构建树（__init__）之后和Tree.setup之后每个节点平均占用的字节数
+"""
+import gc
+import sys
+import tracemalloc
+
+from pybts import *
+
+
+def build(count: int):
+    half = count // 2
+    return Sequence(children=[
+        Sequence(children=[Success() for _ in range(half)]),
+        Sequence(children=[Print(msg='{{round}}') for _ in range(count - half)]),
+    ])
+
+
+def measure(count: int, mode: str) -> tuple[float, float]:
+    gc.collect()
+    tracemalloc.start()
+    root = build(count)
+    after_init = tracemalloc.get_traced_memory()[0]
+    Tree(root=root).setup(mode=mode)
+    after_setup = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    total = len(list(root.iterate()))
+    return after_init / total, after_setup / total
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f'{"mode":<8}{"init B/node":>14}{"setup B/node":>14}')
+    for mode in ['debug', 'lean']:
+        after_init, after_setup = measure(count, mode)
+        print(f'{mode:<8}{after_init:>14.1f}{after_setup:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
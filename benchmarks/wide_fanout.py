@@ -0,0 +1,34 @@
+"""
+很宽的组合节点每帧的开销
+
+python benchmarks/wide_fanout.py
+
+SelectorWithMemory下有N个子节点，前N-1个失败，最后一个一直RUNNING，
+第一帧之后每帧只会重新执行最后一个子节点，每帧的开销应该和N无关
+"""
+import time
+
+from pybts import *
+
+
+def build(width: int):
+    return SelectorWithMemory(children=[Failure() for _ in range(width - 1)] + [Running()])
+
+
+def measure(width: int, engine: str, ticks: int = 2000) -> float:
+    tree = Tree(root=build(width)).setup(engine=engine, mode='lean')
+    tree.tick()
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tree.tick()
+    return (time.perf_counter() - start) / ticks * 1e6
+
+
+def main():
+    print(f'{"width":>8}{"generator us/tick":>20}{"flat us/tick":>16}')
+    for width in [10, 100, 1000, 10000]:
+        print(f'{width:>8}{measure(width, "generator"):>20.2f}{measure(width, "flat"):>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from .tree import Tree
+from .context import Context
 from .nodes import *
 from .composites import *
 from .board import Board
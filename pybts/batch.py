@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import typing
+
+import numpy as np
+import py_trees
+
+from pybts.constants import *
+from pybts.composites import *
+from pybts.decorators import Decorator
+from pybts.engine import FlatEngine, OPCODE
+
+_S = BATCH_STATUS.SUCCESS
+_F = BATCH_STATUS.FAILURE
+_R = BATCH_STATUS.RUNNING
+_I = BATCH_STATUS.INVALID
+
+
+class BatchTree:
+    """
+    多实例同步执行的树（lockstep）
+
+    N个实例共用同一棵树（例如Builder.build_from_file构建出来的树），每个实例只拥有自己的context。
+    每个节点在每个实例上的状态和游标保存在NumPy数组里：
+    - status[n, i]: 第n个实例中第i个节点的状态（BATCH_STATUS编码）
+    - cursor[n, i]: 第n个实例中第i个组合节点当前执行的子节点序号，-1表示没有
+
+    每帧tick时，每个节点只调用一次，参数mask表示本帧需要tick该节点的实例，组合节点的逻辑用数组运算完成，
+    这样每帧的Python调用次数从 N × 节点数 降到 节点数 左右。
+
+    叶子节点需要实现批量的update：
+
+        def batch_update(self, batch: BatchTree, mask: np.ndarray) -> np.ndarray:
+            # 返回长度为N的BATCH_STATUS数组，只有mask为True的位置有意义
+            ...
+
+    可选实现 batch_reset(batch, mask) / batch_stop(batch, mask) 来维护叶子节点自己的批量状态。
+
+    注意：内置叶子节点（IsMatchRule、IsEqual、RandomSuccess）只有参数是常量时才整批计算，
+    参数是模版或者表达式时依赖每个实例自己的context，仍然逐个实例求值，这部分的调用次数还是 N × 节点数。
+
+    支持的节点：Sequence/Selector系列、Parallel、CondBranch、提供batch_status_map的装饰节点，
+    以及实现了batch_update的叶子节点。节点对象本身是共享的，不要在批量执行中读写节点上的单实例状态。
+    """
+
+    def __init__(self, root: py_trees.behaviour.Behaviour, contexts: int | typing.List[dict], name: str = ''):
+        self.root = root
+        self.name = name or root.name
+        if isinstance(contexts, int):
+            contexts = [{ } for _ in range(contexts)]
+        assert len(contexts) > 0, f'BatchTree {self.name}: contexts should not be empty'
+        self.contexts: typing.List[dict] = contexts
+        for context in self.contexts:
+            context['round'] = 0
+        self.count = 0
+        self.layout = FlatEngine(root)  # 只复用它的层序展开
+        self.status = np.zeros((self.size, len(self.layout)), dtype=np.int8)
+        self.cursor = np.full((self.size, len(self.layout)), -1, dtype=np.int32)
+        self._dispatch: typing.List[typing.Callable[[int, np.ndarray], None]] = []
+        self._has_setup = False
+
+    @property
+    def size(self) -> int:
+        """实例数量"""
+        return len(self.contexts)
+
+    @property
+    def nodes(self) -> typing.List[py_trees.behaviour.Behaviour]:
+        return self.layout.nodes
+
+    def setup(self, **kwargs: typing.Any) -> 'BatchTree':
+        """节点的setup只执行一次，setup阶段节点使用第一个实例的context"""
+        assert not self._has_setup, f'BatchTree {self.name} already has setup'
+        self._has_setup = True
+        for node in self.nodes:
+            node.context = self.contexts[0]
+            node.setup(**kwargs)
+        self._dispatch = [self._compile_node(i) for i in range(len(self.nodes))]
+        return self
+
+    def _compile_node(self, i: int) -> typing.Callable[[int, np.ndarray], None]:
+        node = self.nodes[i]
+        opcode = self.layout.opcodes[i]
+        if opcode == OPCODE.SEQ_SEL or (opcode == OPCODE.GENERIC and self.layout.params[i] is not None):
+            # commutative的Sequence/Selector在FlatEngine里按GENERIC执行，批量执行时不重排子节点，仍然按SEQ_SEL处理
+            return self._seq_sel
+        elif opcode == OPCODE.PARALLEL:
+            return self._parallel
+        elif opcode == OPCODE.COND_BRANCH:
+            return self._cond_branch
+        elif isinstance(node, Decorator) and hasattr(node, 'batch_status_map') and len(node.children) == 1:
+            return self._decorator
+        elif len(node.children) == 0 and hasattr(node, 'batch_update'):
+            return self._leaf
+        raise Exception(f'BatchTree {self.name}: {node.__class__.__name__} does not support batch tick')
+
+    def tick(self) -> None:
+        assert self._has_setup, f'BatchTree {self.name} has not been setup'
+        self._dispatch[0](0, np.ones(self.size, dtype=bool))
+        self.count += 1
+
+    def reset(self, mask: np.ndarray = None) -> None:
+        """重置实例，mask为空表示重置所有实例"""
+        if mask is None:
+            mask = np.ones(self.size, dtype=bool)
+        self.status[mask] = _I
+        self.cursor[mask] = -1
+        for n in np.flatnonzero(mask):
+            self.contexts[n]['round'] += 1
+        for node in self.nodes:
+            if hasattr(node, 'batch_reset'):
+                node.batch_reset(self, mask)
+
+    def statuses(self, node: py_trees.behaviour.Behaviour | int = 0) -> typing.List[Status]:
+        """某个节点在所有实例上的状态"""
+        i = node if isinstance(node, int) else self.layout.index_of[id(node)]
+        return [BATCH_STATUS_TO_STATUS[code] for code in self.status[:, i]]
+
+    def _invalidate(self, i: int, mask: np.ndarray) -> None:
+        """将mask中的实例的i节点及其子树停止（置为INVALID）"""
+        mask = mask & (self.status[:, i] != _I)
+        if not mask.any():
+            return
+        node = self.nodes[i]
+        if hasattr(node, 'batch_stop'):
+            node.batch_stop(self, mask)
+        self.status[mask, i] = _I
+        self.cursor[mask, i] = -1
+        for k in range(self.layout.child_start[i], self.layout.child_end[i]):
+            self._invalidate(k, mask)
+
+    def _invalidate_children(self, i: int, mask: np.ndarray) -> None:
+        """节点以INVALID结束时会停止所有子节点"""
+        if not mask.any():
+            return
+        self.cursor[mask, i] = -1
+        for k in range(self.layout.child_start[i], self.layout.child_end[i]):
+            self._invalidate(k, mask)
+
+    def _leaf(self, i: int, mask: np.ndarray) -> None:
+        new_status = np.asarray(self.nodes[i].batch_update(self, mask), dtype=np.int8)
+        self.status[mask, i] = new_status[mask]
+
+    def _decorator(self, i: int, mask: np.ndarray) -> None:
+        k = self.layout.child_start[i]
+        self._dispatch[k](k, mask)
+        child_status = self.status[:, k]
+        new_status = np.asarray(self.nodes[i].batch_status_map, dtype=np.int8)[child_status]
+        # 装饰节点结束时停止仍在运行的子节点
+        self._invalidate(k, mask & (new_status != _R) & (child_status == _R))
+        self.status[mask, i] = new_status[mask]
+        self._invalidate_children(i, mask & (new_status == _I))
+
+    def _seq_sel(self, i: int, mask: np.ndarray) -> None:
+        node = self.nodes[i]
+        tick_again_status = [STATUS_TO_BATCH_STATUS[s] for s in self.layout.tick_again[i](node)]
+        continue_status, no_child_status = self.layout.params[i]
+        continue_status = [STATUS_TO_BATCH_STATUS[s] for s in continue_status]
+        no_child_status = STATUS_TO_BATCH_STATUS[no_child_status]
+
+        start, end = self.layout.child_start[i], self.layout.child_end[i]
+        again = mask & np.isin(self.status[:, i], tick_again_status) & (self.cursor[:, i] >= 0)
+        begin = np.where(again, self.cursor[:, i], node.gen_index())
+
+        active = mask.copy()  # 还需要继续执行后续子节点的实例
+        last = np.full(self.size, -1, dtype=np.int32)  # 最后执行的子节点序号
+        for pos in range(end - start):
+            tick_mask = active & (begin <= pos)
+            if not tick_mask.any():
+                if not (active & (begin > pos)).any():
+                    break
+                continue
+            k = start + pos
+            self._dispatch[k](k, tick_mask)
+            last[tick_mask] = pos
+            active &= ~(tick_mask & ~np.isin(self.status[:, k], continue_status))
+
+        new_status = np.full(self.size, no_child_status, dtype=np.int8)
+        has_child = mask & (last >= 0)
+        rows = np.flatnonzero(has_child)
+        new_status[rows] = self.status[rows, start + last[rows]]
+
+        # 剩余的子节点全部停止
+        for pos in range(end - start):
+            self._invalidate(start + pos, has_child & (last < pos))
+
+        self.cursor[mask, i] = last[mask]
+        self.status[mask, i] = new_status[mask]
+        self._invalidate_children(i, mask & (new_status == _I))
+
+    def _parallel(self, i: int, mask: np.ndarray) -> None:
+        node = self.nodes[i]
+        start, end = self.layout.child_start[i], self.layout.child_end[i]
+        for k in range(start, end):
+            self._dispatch[k](k, mask)
+
+        children_status = self.status[:, start:end]
+        success_threshold = node.success_threshold
+        if success_threshold == -1:
+            success_threshold = end - start
+        new_status = np.where(
+                (children_status == _R).any(axis=1), _R,
+                np.where((children_status == _S).sum(axis=1) >= success_threshold, _S, _F)).astype(np.int8)
+        self.cursor[mask, i] = end - start - 1
+        self.status[mask, i] = new_status[mask]
+
+    def _cond_branch(self, i: int, mask: np.ndarray) -> None:
+        node = self.nodes[i]
+        if node.reactive:
+            tick_again_status = []
+        elif node.memory:
+            tick_again_status = [_R, _F]
+        else:
+            tick_again_status = [_R]
+
+        start, end = self.layout.child_start[i], self.layout.child_end[i]
+        new_status = np.zeros(self.size, dtype=np.int8)
+
+        # 重新执行上次执行的动作节点
+        again = mask & np.isin(self.status[:, i], tick_again_status) & (self.cursor[:, i] > 0)
+        for pos in range(1, end - start):
+            again_mask = again & (self.cursor[:, i] == pos)
+            if again_mask.any():
+                self._dispatch[start + pos](start + pos, again_mask)
+                new_status[again_mask] = self.status[again_mask, start + pos]
+
+        rest = mask & ~again
+        if rest.any():
+            self._dispatch[start](start, rest)
+            condition_status = self.status[:, start]
+            target = np.full(self.size, -1, dtype=np.int32)
+            target[condition_status == _S] = 1
+            if end - start == 3:
+                target[condition_status == _F] = 2
+            target[condition_status == _I] = 0
+            running = rest & (condition_status == _R)
+            finished = rest & ~running
+
+            for pos in range(1, end - start):
+                # 停止其他节点
+                self._invalidate(start + pos, finished & (target != pos))
+
+            new_status[running] = _R
+            self.cursor[running, i] = 0
+            no_target = finished & (target < 0)
+            new_status[no_target] = condition_status[no_target]
+            self.cursor[no_target, i] = -1
+            for pos in range(end - start):
+                target_mask = finished & (target == pos)
+                if target_mask.any():
+                    self._dispatch[start + pos](start + pos, target_mask)
+                    new_status[target_mask] = self.status[target_mask, start + pos]
+                    self.cursor[target_mask, i] = pos
+
+        self.status[mask, i] = new_status[mask]
+        self._invalidate_children(i, mask & (new_status == _I))
@@ -45,7 +45,8 @@ class Board:
             try:
                 utility.json_dump({
                     **json_data,
-                    'tree': tree_data
+                    'tree'    : tree_data,
+                    'counters': self.tree.counters.to_json() if self.tree.counters is not None else None
                 }, f, ensure_ascii=False)
             except Exception as e:
                 print(e)
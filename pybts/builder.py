@@ -167,6 +167,7 @@ class Builder:
                 PostCondition,
                 Switcher,
                 ReactiveSwitcher,
+                Dispatch,
         )
 
         self.register_node(
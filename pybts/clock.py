@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import collections
+import heapq
+import itertools
+import math
+import time
+import typing
+
+import numpy as np
+import py_trees
+
+from pybts.converter import Converter, template_variables, code_names
+
+
+class Clock:
+    """
+    树的时钟，每帧开始时（pre_tick_handler之后）读取一次，这一帧里所有节点看到的都是同一个时间
+
+    source: 时间的来源
+    - 'time': 系统时间（time.monotonic）
+    - 函数: 调用它得到时间
+    - 其他字符串: 从context里计算，例如 {{time}}、{{step}} * 0.1，用于仿真环境
+    节点的time参数和source相同时，Node.get_time直接返回now，不再自己读取时间
+    """
+
+    def __init__(self, source: str | typing.Callable[[], float] = 'time'):
+        self.source = source
+        self.now: typing.Optional[float] = None  # 这一帧的时间，第一次读取之前为None
+        self.converter: typing.Optional[Converter] = None  # 从context计算时间时使用，在Tree.setup时设置
+        # 时间依赖的context变量，仿真时钟每帧都会写这些key，判断树是否空闲时不算作context的变化
+        self.keys: typing.FrozenSet[str] = frozenset()
+        if isinstance(source, str) and source != 'time':
+            if '{{' in source:
+                self.keys = template_variables(source)
+            else:
+                self.keys = code_names(compile(source, '<clock>', 'eval'))
+
+    def read(self) -> float:
+        """读取当前时间并保存到now"""
+        source = self.source
+        if source == 'time':
+            self.now = time.monotonic()
+        elif callable(source):
+            self.now = float(source())
+        else:
+            self.now = self.converter.float(source)
+        return self.now
+
+
+class TimerWheel:
+    """
+    定时器：和时间有关的节点（TimeElapsed、Throttle、Timeout）在这里登记自己下一次结果可能发生变化的时间，
+    树据此知道在某个时间之前不需要tick（参考Tree.idle_until）
+
+    每个节点最多只有一个定时器，重复登记会覆盖之前的时间。用最小堆实现，覆盖和取消只做标记，过期的条目在读取时丢弃
+    """
+
+    def __init__(self):
+        self._heap: typing.List[typing.Tuple[float, int, py_trees.behaviour.Behaviour]] = []
+        self._deadlines: typing.Dict[py_trees.behaviour.Behaviour, typing.Tuple[float, int]] = { }
+        self._serials = itertools.count()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, node: py_trees.behaviour.Behaviour) -> bool:
+        return node in self._deadlines
+
+    def schedule(self, node: py_trees.behaviour.Behaviour, deadline: float) -> None:
+        """登记（或者改变）节点的定时器"""
+        entry = (deadline, next(self._serials))
+        self._deadlines[node] = entry
+        heapq.heappush(self._heap, (entry[0], entry[1], node))
+
+    def cancel(self, node: py_trees.behaviour.Behaviour) -> None:
+        self._deadlines.pop(node, None)
+
+    def deadline_of(self, node: py_trees.behaviour.Behaviour) -> typing.Optional[float]:
+        entry = self._deadlines.get(node)
+        return None if entry is None else entry[0]
+
+    def _discard_stale(self) -> None:
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][2]) != (heap[0][0], heap[0][1]):
+            heapq.heappop(heap)
+
+    def next_deadline(self) -> float:
+        """最早的定时器时间，没有定时器时返回inf"""
+        self._discard_stale()
+        if not self._heap:
+            return math.inf
+        return self._heap[0][0]
+
+    def pop_due(self, now: float) -> typing.List[py_trees.behaviour.Behaviour]:
+        """取出所有到期（deadline <= now）的节点"""
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, node = heapq.heappop(self._heap)
+            del self._deadlines[node]
+            due.append(node)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._deadlines.clear()
+
+    def get_state(self) -> tuple:
+        return self._heap.copy(), self._deadlines.copy()
+
+    def set_state(self, state: tuple) -> None:
+        heap, deadlines = state
+        self._heap = heap.copy()
+        self._deadlines = deadlines.copy()
+
+    def __getstate__(self) -> tuple:
+        return self._heap, self._deadlines, next(self._serials)
+
+    def __setstate__(self, state: tuple) -> None:
+        self._heap, self._deadlines, serial = state
+        self._serials = itertools.count(serial)
+
+
+class RunStats:
+    """
+    Tree.run的统计
+    - ticks: 执行的帧数
+    - periods: 经过的周期数（执行的帧 + 空闲跳过的周期）
+    - idle_skips: 树空闲（参考Tree.idle_until）而跳过的周期数
+    - overruns: 超出周期的帧数（这一帧结束时已经错过了下一帧的开始时间）
+    - elapsed: 总耗时（秒）
+    - latencies: 最近window帧每帧tick的耗时（秒）
+    """
+
+    def __init__(self, window: int = 100000):
+        self.ticks = 0
+        self.periods = 0
+        self.idle_skips = 0
+        self.overruns = 0
+        self.elapsed = 0.0
+        self.latencies: typing.Deque[float] = collections.deque(maxlen=window)
+
+    @property
+    def rate(self) -> float:
+        """实际的tick频率（Hz）"""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.ticks / self.elapsed
+
+    def percentile(self, q: float) -> float:
+        """tick耗时的百分位数（毫秒）"""
+        if len(self.latencies) == 0:
+            return 0.0
+        return float(np.percentile(self.latencies, q)) * 1000
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(50)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(99)
+
+    def to_json(self) -> typing.Dict[str, typing.Any]:
+        return {
+            'ticks'     : self.ticks,
+            'periods'   : self.periods,
+            'idle_skips': self.idle_skips,
+            'overruns'  : self.overruns,
+            'elapsed'   : self.elapsed,
+            'rate'      : self.rate,
+            'p50_ms'    : self.p50,
+            'p99_ms'    : self.p99,
+        }
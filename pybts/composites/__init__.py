@@ -6,6 +6,7 @@ from .condition_branch import CondBranch, ConditionBranch
 from .template import Template
 from .ppa import PreCondition, PostCondition
 from .switcher import Switcher, ReactiveSwitcher
+from .dispatch import Dispatch
 # TODO: RUNNING节点的打断操作应该怎么在行为树上体现出来
 # 通过ReactiveSelector/ReactiveSequence来起到打断后续节点的效果
 # ReactiveSequence: 前面的节点条件如果满足，则会一直
@@ -4,8 +4,11 @@ from pybts.nodes import Node
 from abc import ABC
 import typing
 from py_trees.common import Status
+from pybts.constants import COUNTER
 from py_trees import behaviour
 import itertools
+import math
+import time
 import uuid
 
 
@@ -14,13 +17,27 @@ class Composite(Node, ABC):
     组合节点
     """
 
+    attr_types = {
+        'reactive'        : 'bool',
+        'memory'          : 'bool',
+        'commutative'     : 'bool',
+        'reorder_interval': 'int',
+    }
+
     def __init__(
             self,
             children: typing.Optional[typing.List[py_trees.behaviour.Behaviour]] = None,
             **kwargs
     ):
         super().__init__(children=children, **kwargs)
-        self.current_child: typing.Optional[behaviour.Behaviour] = None
+        # 当前执行的子节点序号，增删子节点时会同步更新，current_child由它得到
+        self.current_index: typing.Optional[int] = None
+        # 被tick过、之后还没有被停止的子节点序号，结束时只需要停止这些子节点，没有启动过的子节点不会被碰到
+        self.active_indices: typing.Set[int] = set()
+        self.active_max = -1  # active_indices中最大序号的上界，没有比游标更靠后的活跃子节点时不需要遍历active_indices
+        # commutative时每个子节点的统计：子节点 -> [执行次数, 通过次数, 总耗时(秒)]
+        self.child_stats: typing.Dict[behaviour.Behaviour, typing.List] = { }
+        self.restart_count = 0  # 从头执行的次数，commutative时每reorder_interval次重排一次子节点
 
     def stop(self, new_status: Status = Status.INVALID) -> None:
         """
@@ -40,13 +57,68 @@ class Composite(Node, ABC):
         super().stop(new_status)
         # Priority interrupt handling
         if new_status == Status.INVALID:
-            self.current_child = None
+            self.current_index = None
+            self.active_indices.clear()
+            self.active_max = -1
             for child in self.children:
                 if (
                         child.status != Status.INVALID
                 ):  # redundant if INVALID->INVALID
                     child.stop(new_status)
 
+    @property
+    def current_child(self) -> typing.Optional[behaviour.Behaviour]:
+        index = self.current_index
+        if index is None:
+            return None
+        return self.children[index]
+
+    @current_child.setter
+    def current_child(self, child: typing.Optional[behaviour.Behaviour]) -> None:
+        # 需要线性查找子节点的位置，tick逻辑里请直接设置current_index
+        if child is None:
+            self.current_index = None
+        else:
+            self.current_index = self.children.index(child)
+
+    def activate(self, index: int) -> None:
+        """记录第index个子节点被tick过"""
+        self.active_indices.add(index)
+        if index > self.active_max:
+            self.active_max = index
+
+    def stop_active_after(self, index: int) -> None:
+        """
+        按顺序停止序号大于index的活跃子节点（Sequence/Selector结束或者停在index时使用）
+        带记忆的Sequence/Selector恢复执行时前面已经结束的子节点都还在active_indices里，
+        游标之后没有活跃子节点时直接返回，每帧的开销和子节点数量无关
+        """
+        if self.active_max <= index:
+            return
+        active = self.active_indices
+        for j in sorted(j for j in active if j > index):
+            active.discard(j)
+            self.children[j].stop(Status.INVALID)
+        self.active_max = index
+
+    def stop_active_children(self, keep: typing.Callable[[int], bool]) -> None:
+        """按顺序停止被tick过的子节点，keep(index)返回True的子节点保留"""
+        active = self.active_indices
+        if len(active) == 0:
+            return
+        for index in sorted(active):
+            if not keep(index):
+                active.discard(index)
+                self.children[index].stop(Status.INVALID)
+
+    def _shift_active_indices(self, position: int, delta: int) -> None:
+        """在position插入（delta=1）或删除（delta=-1）子节点后更新active_indices"""
+        if self.active_max >= position:
+            self.active_max += delta
+        if len(self.active_indices) == 0:
+            return
+        self.active_indices = { index + delta if index >= position else index for index in self.active_indices }
+
     def tip(self) -> typing.Optional[behaviour.Behaviour]:
         """
         Recursive function to extract the last running node of the tree.
@@ -116,18 +188,24 @@ class Composite(Node, ABC):
 
         .. todo:: Error handling for when child is not in this list
         """
-        if self.current_child is not None and (self.current_child.id == child.id):
-            self.current_child = None
+        child_index = self.children.index(child)
+        if self.current_index == child_index:
+            self.current_index = None
         if child.status == Status.RUNNING:
             child.stop(Status.INVALID)
-        child_index = self.children.index(child)
-        self.children.remove(child)
+        del self.children[child_index]
+        if self.current_index is not None and self.current_index > child_index:
+            self.current_index -= 1
+        self.active_indices.discard(child_index)
+        self._shift_active_indices(child_index + 1, -1)
         child.parent = None
         return child_index
 
     def remove_all_children(self) -> None:
         """Remove all children. Makes sure to stop each child if necessary."""
-        self.current_child = None
+        self.current_index = None
+        self.active_indices.clear()
+        self.active_max = -1
         for child in self.children:
             if child.status == Status.RUNNING:
                 child.stop(Status.INVALID)
@@ -184,6 +262,9 @@ class Composite(Node, ABC):
             uuid.UUID: unique id of the child
         """
         self.children.insert(0, child)
+        if self.current_index is not None:
+            self.current_index += 1
+        self._shift_active_indices(0, 1)
         child.parent = self
         return child.id
 
@@ -200,7 +281,12 @@ class Composite(Node, ABC):
         Returns:
             uuid.UUID: unique id of the child
         """
-        self.children.insert(index, child)
+        # 和list.insert一样处理负数和越界的index，算出实际插入的位置
+        position = max(index + len(self.children), 0) if index < 0 else min(index, len(self.children))
+        self.children.insert(position, child)
+        if self.current_index is not None and self.current_index >= position:
+            self.current_index += 1
+        self._shift_active_indices(position, 1)
         child.parent = self
         return child.id
 
@@ -212,36 +298,50 @@ class Composite(Node, ABC):
             start_index: int | typing.Callable[['Composite'], int] = 0
     ):
         """Sequence/Selector的tick逻辑"""
-        self.debug_info['tick_count'] += 1
-        self.logger.debug("%s.tick()" % (self.__class__.__name__))
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        if self.debug:
+            self.counters[COUNTER.TICK] += 1
+            self.logger.debug("%s.tick()" % (self.__class__.__name__))
 
+        commutative = self.commutative
         if self.status in tick_again_status:
             # 重新执行上次执行的子节点
-            assert self.current_child is not None
-            index = self.children.index(self.current_child)
+            assert self.current_index is not None
+            index = self.current_index
         else:
             # Restart
-            self.current_child = None  # 从头执行
+            self.current_index = None  # 从头执行
+            if commutative:
+                self.restart_count += 1
+                if self.restart_count % self.param('reorder_interval', 100) == 0:
+                    self.reorder_children()
             if callable(start_index):
                 start_index = start_index(self)
             index = start_index
 
-        for child in itertools.islice(self.children, index, None):
-            self.current_child = child
-            yield from child.tick()
+        children = self.children
+        # 用下标遍历，itertools.islice跳过前面的子节点也是线性的
+        for index in range(index, len(children)):
+            child = children[index]
+            self.current_index = index
+            self.activate(index)
+            if commutative:
+                start_time = time.perf_counter()
+                yield from child.tick()
+                self.record_child(child, time.perf_counter() - start_time, child.status in continue_status)
+            else:
+                yield from child.tick()
             if child.status not in continue_status:
                 # 不在Next里，停止执行
                 break
 
-        if self.current_child is not None:
-            new_status = self.current_child.status
-
-            index = self.children.index(self.current_child)
+        if self.current_index is not None:
+            index = self.current_index
+            new_status = children[index].status
 
-            # 剩余的子节点全部停止
-            for child in itertools.islice(self.children, index + 1, None):
-                # 清除子节点的状态（停止正在执行的子节点）
-                child.stop(Status.INVALID)
+            # 剩余的（被tick过的）子节点全部停止
+            self.stop_active_after(index)
         else:
             new_status = no_child_status
 
@@ -254,8 +354,11 @@ class Composite(Node, ABC):
 
     def switch_tick(self, index: int | typing.Callable[['Composite'], int], tick_again_status: list[Status]) -> \
             typing.Iterator[py_trees.behaviour.Behaviour]:
-        self.debug_info['tick_count'] += 1
-        self.logger.debug("%s.tick()" % (self.__class__.__name__))
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        if self.debug:
+            self.counters[COUNTER.TICK] += 1
+            self.logger.debug("%s.tick()" % (self.__class__.__name__))
 
         if self.status in tick_again_status:
             # 重新执行上次执行的子节点
@@ -263,13 +366,23 @@ class Composite(Node, ABC):
         else:
             if callable(index):
                 index = index(self)
-            self.current_child = self.children[index]  # 执行对应的index
-
-        yield from self.current_child.tick()
-        for child in self.children:
-            if child != self.current_child:
-                # 清除子节点的状态（停止正在执行的子节点）
-                child.stop(Status.INVALID)
+            if index is None:
+                # 没有需要执行的子节点（例如Dispatch没有匹配的子节点）
+                self.current_index = None
+                self.stop_active_children(keep=lambda j: False)
+                self.stop(Status.FAILURE)
+                self.status = Status.FAILURE
+                yield self
+                return
+            self.children[index]  # 越界时抛出IndexError
+            self.current_index = index % len(self.children)  # 执行对应的index
+
+        current_index = self.current_index
+        current_child = self.children[current_index]
+        self.activate(current_index)
+        yield from current_child.tick()
+        # 清除其他子节点的状态（停止正在执行的子节点）
+        self.stop_active_children(keep=lambda j: j == current_index)
 
         new_status = self.current_child.status
         if new_status != Status.RUNNING:
@@ -284,23 +397,71 @@ class Composite(Node, ABC):
 
     @property
     def reactive(self) -> bool:
-        return self.converter.bool(self.attrs.get('reactive', False))
+        return self.param('reactive', False)
 
     @property
     def memory(self) -> bool:
-        return self.converter.bool(self.attrs.get('memory', False))
+        return self.param('memory', False)
 
     @property
-    def current_index(self):
-        if self.current_child is None:
-            return None
-        else:
-            return self.children.index(self.current_child)
+    def commutative(self) -> bool:
+        """
+        子节点的执行顺序是否不影响结果（例如And/Or里的纯条件）
+        为True时会统计每个子节点的耗时和通过率，并定期按期望开销重新排列子节点
+        """
+        return self.param('commutative', False)
+
+    def record_child(self, child: behaviour.Behaviour, cost: float, passed: bool) -> None:
+        """记录子节点的一次执行，passed表示子节点的结果让组合节点继续执行后面的子节点"""
+        stats = self.child_stats.get(child)
+        if stats is None:
+            stats = self.child_stats[child] = [0, 0, 0.0]
+        stats[0] += 1
+        stats[1] += passed
+        stats[2] += cost
+
+    def expected_cost(self, child: behaviour.Behaviour) -> float:
+        """
+        子节点的排序依据：平均耗时 / 短路概率
+        按这个值从小到大排列时，执行到短路为止的期望总耗时最小；没有统计过的子节点排在最前面，先采样
+        """
+        stats = self.child_stats.get(child)
+        if stats is None or stats[0] == 0:
+            return 0.0
+        count, passed, total_time = stats
+        stop_rate = 1 - passed / count
+        if stop_rate == 0:
+            return math.inf
+        return total_time / count / stop_rate
+
+    def reorder_children(self) -> bool:
+        """按期望开销重新排列子节点（只在从头执行前调用），返回顺序是否有变化"""
+        children = self.children
+        order = sorted(range(len(children)), key=lambda j: self.expected_cost(children[j]))  # 稳定排序
+        if all(j == position for position, j in enumerate(order)):
+            return False
+        new_index = { j: position for position, j in enumerate(order) }
+        children[:] = [children[j] for j in order]  # 保持同一个列表对象
+        self.active_indices = { new_index[j] for j in self.active_indices }
+        self.active_max = max(self.active_indices, default=-1)
+        if self.current_index is not None:
+            self.current_index = new_index[self.current_index]
+        return True
 
     def to_data(self):
-        return {
+        data = {
             **super().to_data(),
             'reactive'     : self.reactive,
             'memory'       : self.memory,
             'current_index': self.current_index
         }
+        if self.child_stats:
+            data['child_stats'] = [
+                {
+                    'name'     : child.name,
+                    'count'    : self.child_stats[child][0],
+                    'pass_rate': self.child_stats[child][1] / self.child_stats[child][0],
+                    'cost'     : self.child_stats[child][2] / self.child_stats[child][0],
+                } for child in self.children if child in self.child_stats and self.child_stats[child][0] > 0
+            ]
+        return data
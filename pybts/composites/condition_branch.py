@@ -37,9 +37,12 @@ class CondBranch(Composite):
         assert len(self.children) in [2, 3], 'ConditionBranch must have 2 or 3 children'
 
     def cond_tick(self: Composite, tick_again_status: list[Status]):
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
         if self.status in tick_again_status and self.current_index != 0:
             assert self.current_child is not None
             # 重新执行上次执行的动作节点
+            self.activate(self.current_index)
             yield from self.current_child.tick()
             new_status = self.current_child.status
             if new_status != Status.RUNNING:
@@ -49,7 +52,8 @@ class CondBranch(Composite):
             return
 
         condition = self.children[0]
-        self.current_child = condition
+        self.current_index = 0
+        self.activate(0)
         yield from condition.tick()
 
         if condition.status == Status.RUNNING:
@@ -59,21 +63,21 @@ class CondBranch(Composite):
 
         if condition.status == Status.SUCCESS:
             # 执行第1个节点
-            self.current_child = self.children[1]
+            self.current_index = 1
         elif condition.status == Status.FAILURE:
             # 执行第2个节点（如果第二个节点存在的话）
             if len(self.children) == 3:
-                self.current_child = self.children[2]
+                self.current_index = 2
             else:
-                self.current_child = None
+                self.current_index = None
 
-        for child in self.children[1:]:
-            # 停止其他节点
-            if child != self.current_child:
-                child.stop(Status.INVALID)
+        # 停止其他节点
+        current_index = self.current_index
+        self.stop_active_children(keep=lambda j: j == 0 or j == current_index)
 
         # 执行选择的子节点
         if self.current_child is not None:
+            self.activate(current_index)
             yield from self.current_child.tick()
             new_status = self.current_child.status
         else:
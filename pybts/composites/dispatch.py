@@ -0,0 +1,79 @@
+from __future__ import annotations
+import typing
+
+from pybts.composites.switcher import Switcher
+
+
+class Dispatch(Switcher):
+    """
+    按键值分发的选择节点，适合状态机一样的树
+    每帧只计算一次key，然后通过setup时建立的字典直接找到对应的子节点执行，
+    代替由很多个CondBranch(IsEqual(a="{{state}}", b="X"), ...)组成的Selector的线性扫描
+
+    key: 键值，一般是jinja2模版，例如{{state}}，渲染成字符串之后和case比较
+    cases: 每个子节点对应的键值，用逗号分隔，例如 "idle,patrol,attack"，
+        不传的话使用每个子节点自己的case属性（xml中写在子节点上）
+        case为空或者为default的子节点是默认子节点，没有匹配的子节点时执行，最多只能有一个
+    没有匹配的子节点也没有默认子节点时返回FAILURE
+
+    <Dispatch key="{{state}}">
+        <Patrol case="patrol"/>
+        <Attack case="attack"/>
+        <Idle case="default"/>
+    </Dispatch>
+
+    其他行为和Switcher一致：当前执行的子节点返回RUNNING时下一帧会继续执行它，设置reactive="true"则每帧都重新分发
+    """
+
+    DEFAULT_CASE = 'default'
+
+    attr_types = {
+        'key': 'str'
+    }
+
+    def __init__(self, key: str = '', cases: str | typing.List[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+        self.cases = cases
+        self.case_index: typing.Dict[str, int] = { }  # case -> 子节点序号，在setup时生成
+        self.default_index: typing.Optional[int] = None
+
+    def setup(self, **kwargs: typing.Any) -> None:
+        super().setup(**kwargs)
+        self.build_cases()
+
+    def build_cases(self):
+        """根据cases或者子节点的case属性建立case -> 子节点序号的字典，修改了子节点之后需要重新调用"""
+        if self.cases is None:
+            cases = [child.attrs.get('case', '') if hasattr(child, 'attrs') else '' for child in self.children]
+        elif isinstance(self.cases, str):
+            cases = [case.strip() for case in self.cases.split(',')]
+        else:
+            cases = [str(case) for case in self.cases]
+        assert len(cases) == len(self.children), \
+            f'Dispatch {self.name}: {len(cases)} cases for {len(self.children)} children'
+
+        defaults = [index for index, case in enumerate(cases) if case == '' or case == self.DEFAULT_CASE]
+        if len(defaults) > 1:
+            names = ', '.join(self.children[index].name for index in defaults)
+            raise Exception(f'Dispatch {self.name}: more than one default child ({names}), '
+                            f'set case on every child or pass cases')
+
+        self.case_index = { }
+        self.default_index = defaults[0] if defaults else None
+        for index, case in enumerate(cases):
+            if index == self.default_index:
+                continue
+            if case in self.case_index:
+                raise Exception(f'Dispatch {self.name}: duplicate case {case}')
+            self.case_index[case] = index
+
+    def gen_index(self) -> typing.Optional[int]:
+        return self.case_index.get(self.param('key'), self.default_index)
+
+    def to_data(self):
+        return {
+            **super().to_data(),
+            'cases'  : self.case_index,
+            'default': self.default_index,
+        }
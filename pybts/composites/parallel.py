@@ -2,6 +2,7 @@ from pybts.composites.composite import Composite
 import py_trees
 import typing
 from py_trees.common import Status
+from pybts.constants import COUNTER
 
 
 class Parallel(Composite):
@@ -34,13 +35,16 @@ class Parallel(Composite):
             - RUNNING 状态的子节点在下一次tick时会继续执行，非RUNNING状态的子节点在下一次tick时会重置并重新开始
             - success_threshold 设置为 -1 表示所有子节点都必须成功才算总体成功
             """
-        self.debug_info['tick_count'] += 1
-        self.logger.debug("%s.tick()" % (self.__class__.__name__))
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        if self.debug:
+            self.counters[COUNTER.TICK] += 1
+            self.logger.debug("%s.tick()" % (self.__class__.__name__))
 
-        self.current_child = None
+        self.current_index = None
 
         for i, child in enumerate(self.children):
-            self.current_child = child
+            self.current_index = i
             yield from child.tick()
 
         running_nodes = [child for child in self.children if child.status == Status.RUNNING]
@@ -21,6 +21,10 @@ class Switcher(Composite):
     - random: 随机数
     """
 
+    attr_types = {
+        'index': 'int'
+    }
+
     def __init__(self, index: typing.Union[int, str] = 'random', **kwargs):
         super().__init__(**kwargs)
         self.index = index
@@ -29,7 +33,7 @@ class Switcher(Composite):
         if self.index == 'random':
             return random.randint(0, len(self.children) - 1)
         else:
-            return self.converter.int(self.index)
+            return self.param('index')
 
     def tick_again_status(self: Composite):
         """计算需要重新执行的状态"""
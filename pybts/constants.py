@@ -172,3 +172,53 @@ class BT_PRESET_DATA_KEY:
     FEEDBACK_MESSAGES = 'feedback_messages'
     NAME = 'name'
     CHILDREN_COUNT = 'children_count'
+
+
+class BATCH_STATUS:
+    """BatchTree中用整数编码的状态"""
+    INVALID = 0
+    SUCCESS = 1
+    FAILURE = 2
+    RUNNING = 3
+
+
+STATUS_TO_BATCH_STATUS = {
+    Status.INVALID: BATCH_STATUS.INVALID,
+    Status.SUCCESS: BATCH_STATUS.SUCCESS,
+    Status.FAILURE: BATCH_STATUS.FAILURE,
+    Status.RUNNING: BATCH_STATUS.RUNNING,
+}
+
+BATCH_STATUS_TO_STATUS = [Status.INVALID, Status.SUCCESS, Status.FAILURE, Status.RUNNING]
+
+
+class COUNTER:
+    """节点计数表中每一列的含义（参考CounterTable）"""
+    TICK = 0
+    UPDATE = 1
+    TERMINATE = 2
+    INITIALISE = 3
+    SUCCESS = 4
+    FAILURE = 5
+    INVALID = 6
+    RUNNING = 7
+
+
+# 和COUNTER的列一一对应，也是to_data中debug_info的键
+COUNTER_KEYS = [
+    'tick_count',
+    'update_count',
+    'terminate_count',
+    'initialise_count',
+    'success_count',
+    'failure_count',
+    'invalid_count',
+    'running_count'
+]
+
+STATUS_TO_COUNTER = {
+    Status.SUCCESS: COUNTER.SUCCESS,
+    Status.FAILURE: COUNTER.FAILURE,
+    Status.INVALID: COUNTER.INVALID,
+    Status.RUNNING: COUNTER.RUNNING,
+}
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import typing
+
+
+class Context(dict):
+    """
+    带依赖追踪的context
+
+    和普通dict用法一致，额外记录：
+    - version: 全局写入版本号，每次写入（赋值/删除/update等）加1
+    - 每个key最后一次写入时的版本号
+
+    在track()和untrack()之间读取的key会被记录下来，纯条件节点（Node.pure=True）据此判断
+    上一次update之后它读取过的key有没有被写过，没有的话直接沿用上一次的状态，不再执行update。
+
+    注意：只有顶层key的写入能被追踪到，直接修改嵌套的对象（例如 context['agent']['x'] = 1）
+    需要重新赋值 context['agent'] = agent 或者调用 context.touch('agent')
+
+    pure_results保存纯条件节点的结果（Node.pure_key -> (版本, 读取的key, 状态)），
+    相同的纯条件节点出现在树的多个地方时只需要计算一次
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self._versions: typing.Dict[typing.Any, int] = { }
+        self._reads: typing.Optional[set] = None  # 正在记录的读取集合，None表示没有在记录
+        self.pure_results: typing.Dict[tuple, tuple] = { }
+
+    @property
+    def tracking(self) -> bool:
+        return self._reads is not None
+
+    def track(self) -> typing.Optional[set]:
+        """开始记录读取的key，返回上一层正在记录的集合，结束时需要传给untrack"""
+        outer = self._reads
+        self._reads = set()
+        return outer
+
+    def untrack(self, outer: typing.Optional[set] = None) -> set:
+        """结束记录，返回这段时间读取的key，嵌套记录时读取的key也会并入外层"""
+        reads = self._reads
+        self._reads = outer
+        if outer is not None:
+            outer.update(reads)
+        return reads
+
+    def record(self, keys: typing.Iterable) -> None:
+        """手动记录读取的key（例如模版、表达式里静态分析出来的变量）"""
+        if self._reads is not None:
+            self._reads.update(keys)
+
+    def changed_since(self, version: int, keys: typing.Iterable) -> bool:
+        """keys中是否有key在version之后被写过"""
+        if version == self.version:
+            return False
+        versions = self._versions
+        for key in keys:
+            if versions.get(key, 0) > version:
+                return True
+        return False
+
+    def written_since(self, version: int) -> typing.Set:
+        """version之后被写过的key"""
+        if version == self.version:
+            return set()
+        return { key for key, key_version in self._versions.items() if key_version > version }
+
+    def touch(self, *keys) -> None:
+        """标记key被修改过（用于原地修改了嵌套对象的情况）"""
+        self.version += 1
+        for key in keys:
+            self._versions[key] = self.version
+
+    def __getitem__(self, key):
+        if self._reads is not None:
+            self._reads.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if self._reads is not None:
+            self._reads.add(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        if self._reads is not None:
+            self._reads.add(key)
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.touch(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.touch(key)
+
+    def pop(self, key, *args):
+        value = super().pop(key, *args)
+        self.touch(key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.touch(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if not super().__contains__(key):
+            self[key] = default
+        return super().__getitem__(key)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        super().update(other)
+        self.touch(*other.keys())
+
+    def clear(self):
+        keys = list(self.keys())
+        super().clear()
+        self.touch(*keys)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def copy(self) -> 'Context':
+        return Context(self)
+
+    def __reduce__(self):
+        # 只保存数据，版本号、读取记录和纯条件节点的结果不需要保存
+        return self.__class__, (dict(self),)
@@ -1,10 +1,15 @@
 import typing
 import jinja2
+import jinja2.meta
 import json
 from py_trees.common import Status
 from typing import Union
 import math
 import random
+import functools
+import ast
+import re
+from pybts.context import Context
 
 _STATUS_MAP = {
     'SUCCESS': Status.SUCCESS,
@@ -13,11 +18,299 @@ _STATUS_MAP = {
     'INVALID': Status.INVALID
 }
 
+# 进程内共享的编译缓存：同一个源字符串只编译一次
+TEMPLATE_CACHE_SIZE = 4096
+EXPRESSION_CACHE_SIZE = 4096
+
+_JINJA_ENV = jinja2.Environment()
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: str) -> jinja2.Template:
+    """编译jinja2模版，结果按源字符串缓存（LRU）"""
+    return _JINJA_ENV.from_string(source)
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(source: str):
+    """编译python表达式，返回可以直接eval的code对象，结果按源字符串缓存（LRU）"""
+    return compile(source, '<pybts>', 'eval')
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def template_variables(source: str) -> typing.FrozenSet[str]:
+    """模版里用到的context变量"""
+    return frozenset(jinja2.meta.find_undeclared_variables(_JINJA_ENV.parse(source)))
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def code_names(code) -> typing.FrozenSet[str]:
+    """code对象里（包括推导式等嵌套的code）用到的名字，属性名也会算进去，只会多不会少"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_names'):
+            names.update(code_names(const))
+    return frozenset(names)
+
+
+_PLACEHOLDER = re.compile(r'{{(.*?)}}', re.S)
+_CONTEXT_NAME = '__context__'
+_GETATTR_NAME = '__getattr__'
+
+
+def _jinja_getattr(obj: typing.Any, attribute: str) -> typing.Any:
+    """和jinja2的 a.b 语义一致：先取属性，取不到再按下标取（context里大多是dict）"""
+    try:
+        return getattr(obj, attribute)
+    except AttributeError:
+        try:
+            return obj[attribute]
+        except (TypeError, LookupError):
+            raise AttributeError(f'{obj!r} has no attribute {attribute}')
+
+
+class _PlaceholderTransformer(ast.NodeTransformer):
+    """
+    把占位符里的jinja表达式改写成python表达式：
+    - 变量 x 改成 __context__['x']，只从context里查找（和jinja渲染时一致）
+    - 属性 a.b 改成 __getattr__(a, 'b')
+    """
+
+    def visit_Name(self, node: ast.Name):
+        if not isinstance(node.ctx, ast.Load):
+            return node
+        return ast.copy_location(
+                ast.Subscript(value=ast.Name(id=_CONTEXT_NAME, ctx=ast.Load()), slice=ast.Constant(node.id),
+                              ctx=ast.Load()), node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self.generic_visit(node)
+        if not isinstance(node.ctx, ast.Load):
+            return node
+        return ast.copy_location(
+                ast.Call(func=ast.Name(id=_GETATTR_NAME, ctx=ast.Load()), args=[node.value, ast.Constant(node.attr)],
+                         keywords=[]), node)
+
+
+_LOCAL_NAME = '__p{}__'
+_SCALAR_LITERALS = frozenset({ int, bool, type(None) })
+
+
+def _is_literal(value: typing.Any) -> bool:
+    """
+    value渲染成字符串（jinja按str()渲染）之后再当成python表达式解析，得到的是否还是同一个值
+    数字、bool、None，以及由它们和字符串组成的list/tuple/dict是；单独的字符串不是（渲染后会被当成表达式解析）
+    """
+    value_type = type(value)
+    if value_type in _SCALAR_LITERALS:
+        return True
+    elif value_type is float:
+        return math.isfinite(value)
+    elif value_type is list or value_type is tuple:
+        return all(type(item) is str or _is_literal(item) for item in value)
+    elif value_type is dict:
+        return all((type(key) is str or _is_literal(key)) and (type(item) is str or _is_literal(item))
+                   for key, item in value.items())
+    return False
+
+
+def _is_operand(value: typing.Any) -> bool:
+    """
+    value是字面量，并且渲染出来的文本本身就是一个完整的操作数，代入表达式后和渲染再解析的结合方式相同
+    负数渲染成 -2，和前后的运算符结合的优先级不同（例如 -2 ** 2 == -4），只能按渲染的语义处理
+    """
+    value_type = type(value)
+    if value_type is int:
+        return value >= 0
+    elif value_type is float:
+        return math.isfinite(value) and math.copysign(1, value) > 0
+    return _is_literal(value)
+
+
+class NativeExpression:
+    """
+    包含{{...}}占位符的表达式的单次求值版本（参考compile_native_expression）
+    - placeholders: 每个占位符改写成的python表达式，只从context取值
+    - code: 整个表达式，占位符换成局部变量__p0__、__p1__...
+
+    每个占位符在表达式里必须是一个独立的操作数（解析后是单独的变量名），否则抛出SyntaxError，只能先渲染再求值：
+    例如 {{c}}{{b}}（渲染后拼成一个数）、'{{x}}'（在字符串里）、{{x}}.real（整数渲染后和点号拼成小数）
+    """
+    __slots__ = ('placeholders', 'names', 'code')
+
+    def __init__(self, source: str):
+        placeholders = []
+
+        def replace(match: re.Match) -> str:
+            tree = ast.parse(match.group(1).strip(), mode='eval')
+            tree = ast.fix_missing_locations(_PlaceholderTransformer().visit(tree))
+            placeholders.append(compile(tree, '<pybts>', 'eval'))
+            return _LOCAL_NAME.format(len(placeholders) - 1)
+
+        tree = ast.parse(_PLACEHOLDER.sub(replace, source), mode='eval')
+        names = tuple(_LOCAL_NAME.format(i) for i in range(len(placeholders)))
+        operands = [node.id for node in ast.walk(tree) if isinstance(node, ast.Name)]
+        attributes = { node.value.id for node in ast.walk(tree)
+                       if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) }
+        for name in names:
+            if operands.count(name) != 1 or name in attributes:
+                raise SyntaxError(f'placeholder is not a standalone operand in {source!r}')
+        self.code = compile(tree, '<pybts>', 'eval')
+        self.placeholders = tuple(placeholders)
+        self.names = names
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_native_expression(source: str) -> typing.Optional[NativeExpression]:
+    """
+    将包含{{...}}占位符的表达式编译成NativeExpression，占位符直接变成context查找，
+    例如 {{agent.x}} > 10 的占位符编译成 __getattr__(__context__['agent'], 'x')，整个表达式编译成 (__p0__) > 10，
+    占位符的值是字面量时（参考Converter.eval_native）不再渲染成字符串，得到的是python原生类型。
+    占位符里用了python不支持的jinja语法（例如过滤器）、或者占位符不是独立的操作数时返回None，只能先渲染再求值
+    """
+    try:
+        return NativeExpression(source)
+    except SyntaxError:
+        return None
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def check_template_expression(source: str) -> None:
+    """
+    不能编译成NativeExpression的模版表达式，在setup时检查语法：每个占位符换成一个操作数（数字或者变量名）之后编译，
+    两种都不能编译时抛出SyntaxError，不用等到第一次tick才发现
+    包含{% %}、{# #}等jinja专有结构的表达式渲染前无法判断，不检查
+    """
+    compile_template(source)  # jinja2自身的语法错误
+    if '{%' in source or '{#' in source:
+        return
+    error = None
+    for operand in ['1', '__p__']:
+        try:
+            compile(_PLACEHOLDER.sub(operand, source), '<pybts>', 'eval')
+            return
+        except SyntaxError as e:
+            error = error or e
+    raise SyntaxError(f'invalid expression {source!r}: {error.msg}')
+
+
+def cache_info() -> typing.Dict[str, dict]:
+    """模版/表达式缓存的命中情况"""
+    return {
+        'template'  : compile_template.cache_info()._asdict(),
+        'expression': compile_expression.cache_info()._asdict(),
+        'native'    : compile_native_expression.cache_info()._asdict(),
+    }
+
+
+def cache_clear():
+    compile_template.cache_clear()
+    compile_expression.cache_clear()
+    compile_native_expression.cache_clear()
+    check_template_expression.cache_clear()
+
+
+def is_template(value: typing.Any) -> bool:
+    return isinstance(value, str) and '{{' in value and '}}' in value
+
+
+class Binding:
+    """
+    预编译的节点参数，在Node.setup时根据原始值和类型分类，之后读取参数不再重复解析：
+    - constant: 常量，只转换一次
+    - template: 纯字符串模版，每次读取时渲染
+    - expression: python表达式，每次读取时求值，语法错误会在setup时抛出（包括模版表达式，参考check_template_expression）。
+      包含模版的表达式会编译成单次求值的python表达式（见compile_native_expression），
+      占位符的值不是字面量（例如字符串，渲染之后会被当成表达式解析）时退回到先渲染再求值，保持和渲染一致的语义
+
+    type: float/int/bool/str/list/dict，空字符串表示不做类型转换（按字符串模版处理）
+    """
+    __slots__ = ('source', 'type', 'kind', 'value', 'code', 'native', '_cast')
+
+    CONSTANT = 'constant'
+    TEMPLATE = 'template'
+    EXPRESSION = 'expression'
+
+    _CASTS = {
+        'float': float,
+        'int'  : int,
+        'bool' : bool,
+    }
+
+    def __init__(self, source: typing.Any, type: str = ''):
+        self.source = source
+        self.type = type
+        self.value = None
+        self.code = None
+        self.native = False  # code是否是compile_native_expression编译的NativeExpression
+        self._cast = self._CASTS.get(type)
+
+        if not isinstance(source, str):
+            self.kind = self.CONSTANT
+            self.value = self.cast(source)
+        elif type in ['', 'str']:
+            self.kind = self.TEMPLATE if is_template(source) else self.CONSTANT
+            self.value = source
+        elif is_template(source):
+            self.kind = self.EXPRESSION
+            self.code = compile_native_expression(source)  # None: 占位符里有jinja专有语法，只能先渲染再求值
+            self.native = self.code is not None
+            if not self.native:
+                check_template_expression(source)
+        elif type == 'bool' and source.lower() in ['true', 'false']:
+            self.kind = self.CONSTANT
+            self.value = source.lower() == 'true'
+        else:
+            try:
+                self.value = self.cast(ast.literal_eval(source))
+                self.kind = self.CONSTANT
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                self.kind = self.EXPRESSION
+                self.code = compile_expression(source)
+
+    def cast(self, value: typing.Any) -> typing.Any:
+        if self._cast is None:
+            return value
+        return self._cast(value)
+
+    def __call__(self, converter: 'Converter') -> typing.Any:
+        if self.kind == self.CONSTANT:
+            return self.value
+        elif self.kind == self.TEMPLATE:
+            return converter.render(self.source)
+        elif self.native:
+            done, value = converter.eval_native(self.code)
+            if not done:
+                value = converter.eval_rendered(converter.render(self.source))
+            return self.cast(value)
+        elif self.code is not None:
+            return self.cast(converter.eval(self.code))
+        else:
+            return self.cast(converter.eval_rendered(converter.render(self.source)))
+
+    def __str__(self):
+        return str(self.source)
+
+    def __repr__(self):
+        return f'Binding({self.kind}, {self.source!r})'
+
+    def __reduce__(self):
+        # 编译好的code对象不能pickle，只保存原始值和类型，反序列化时重新分类（编译结果有缓存）
+        return self.__class__, (self.source, self.type)
+
 
 class Converter:
+    __slots__ = ('node', '_context')
 
-    def __init__(self, node):
+    def __init__(self, node, context: dict = None):
         self.node = node
+        self._context = context  # 不传的话使用节点自身的context，BatchTree会传入每个实例各自的context
+
+    @property
+    def context(self) -> dict:
+        if self._context is None:
+            return self.node.context
+        return self._context
 
     def parse(self, value: typing.Any, type: str):
         if type == "float":
@@ -43,24 +336,87 @@ class Converter:
                 return True
             elif value.lower() == 'false':
                 return False
-            return bool(self.eval(self.render(value)))
+            return bool(self.evaluate(value))
         return bool(value)
 
     def float(self, value: typing.Any):
         if isinstance(value, str):
-            return float(self.eval(self.render(value)))
+            return float(self.evaluate(value))
         else:
             return float(value)
 
     def int(self, value: typing.Any):
         if isinstance(value, str):
-            return int(self.eval(self.render(value)))
+            return int(self.evaluate(value))
         else:
             return int(value)
 
-    def eval(self, value: str):
-        return eval(value, self.node.context,
-                    { 'math': math, 'random': random, 'name': self.node.name })
+    def bind(self, value: typing.Any, type: str = '') -> Binding:
+        return Binding(value, type)
+
+    def eval(self, value: str, **kwargs):
+        """
+        value: 表达式的源字符串（编译结果会缓存）或者编译好的code对象
+        kwargs: 额外的局部变量
+        """
+        if isinstance(value, str):
+            value = compile_expression(value)
+        return self._eval_code(value, code_names(value), kwargs)
+
+    def eval_rendered(self, value: str, **kwargs):
+        """
+        对模版渲染之后的字符串求值
+        渲染结果随context变化（例如 12 > 10、13 > 10），几乎不会重复，不放进compile_expression的缓存，以免挤掉源表达式
+        """
+        code = compile(value, '<pybts>', 'eval')
+        return self._eval_code(code, code_names.__wrapped__(code), kwargs)
+
+    def _eval_code(self, code, names: typing.FrozenSet[str], kwargs: dict):
+        context = self.context
+        if isinstance(context, Context) and context.tracking:
+            # eval读取全局变量时不会经过Context.__getitem__，只能静态记录
+            context.record(names)
+        return eval(code, context, {
+            'math'       : math,
+            'random'     : random,
+            'name'       : self.node.name,
+            _CONTEXT_NAME: self.context,
+            _GETATTR_NAME: _jinja_getattr,
+            **kwargs
+        })
+
+    def eval_native(self, expression: NativeExpression, **kwargs) -> typing.Tuple[bool, typing.Any]:
+        """
+        先对每个占位符取值，都是渲染后仍然是完整操作数的字面量（参考_is_operand）时直接代入求值，结果和先渲染再求值相同，返回(True, 结果)
+        否则返回(False, None)，需要先渲染再求值（字符串等渲染之后会被重新解析，只能按渲染的语义处理）
+        只有占位符取值失败（例如key不存在，渲染时是空字符串）才会走渲染，表达式本身抛出的异常不会被捕获，也不会执行两次
+        """
+        values = { }
+        for name, code in zip(expression.names, expression.placeholders):
+            try:
+                value = self.eval(code)
+            except (LookupError, AttributeError, TypeError):
+                return False, None
+            if not _is_operand(value):
+                return False, None
+            values[name] = value
+        return True, self.eval(expression.code, **values, **kwargs)
+
+    def evaluate(self, value: str, **kwargs):
+        """
+        表达式求值，{{...}}占位符的值是数字、bool等字面量时直接代入，返回python原生类型，例如：
+        - {{agent.x}} > 10 -> bool
+        - {{a}} * 2 -> a的类型
+        其他情况（占位符是字符串、用了jinja专有语法等）先渲染成字符串再求值
+        """
+        if not is_template(value):
+            return self.eval(value, **kwargs)
+        expression = compile_native_expression(value)
+        if expression is not None:
+            done, result = self.eval_native(expression, **kwargs)
+            if done:
+                return result
+        return self.eval_rendered(self.render(value), **kwargs)
 
     @classmethod
     def status(cls, value: Union[str, Status]) -> Status:
@@ -113,10 +469,15 @@ class Converter:
         if '{{' not in value or '}}' not in value:
             return value
 
+        context = self.context
+        tracking = isinstance(context, Context) and context.tracking
         for i in range(3):
             # 最多嵌套3层
-            rendered_value = jinja2.Template(value).render(
-                    self.node.context, math=math, random=random,
+            if tracking:
+                # jinja2渲染时会先把context复制成普通dict，读取不会经过Context.__getitem__
+                context.record(template_variables(value))
+            rendered_value = compile_template(value).render(
+                    self.context, math=math, random=random,
                     name=self.node.name)
             if '{{' not in rendered_value or '}}' not in rendered_value:
                 return rendered_value
@@ -127,7 +488,7 @@ class Converter:
 
     def list(self, value: typing.Any) -> typing.List[typing.Any]:
         if isinstance(value, str):
-            return eval(self.render(value))
+            return self.evaluate(value)
         elif isinstance(value, list):
             return value
         elif isinstance(value, tuple):
@@ -149,7 +510,7 @@ class Converter:
 
     def dict(self, value: typing.Any) -> typing.Dict[str, typing.Any]:
         if isinstance(value, str):
-            return self.eval(self.render(value))
+            return self.evaluate(value)
         elif isinstance(value, dict):
             return value
         else:
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import typing
+
+import numpy as np
+import py_trees
+
+from pybts.constants import COUNTER_KEYS
+
+
+class CounterTable:
+    """
+    整棵树的节点计数表
+
+    所有节点的计数（tick/update/terminate/initialise次数以及各个状态的结束次数）保存在一个连续的二维数组里：
+    data[i, COUNTER.XXX] 是第i个节点（按root.iterate()的顺序）的计数。
+    Tree.setup时每个节点拿到自己那一行的视图（node.counters），计数直接写进这个数组，
+    所以重置整棵树的计数只需要一次fill(0)，导出所有计数也只需要一次tolist()。
+    """
+
+    def __init__(self, nodes: typing.Iterable[py_trees.behaviour.Behaviour]):
+        self.nodes = list(nodes)
+        self.data = np.zeros((len(self.nodes), len(COUNTER_KEYS)), dtype=np.int64)
+        self.index_of: typing.Dict[int, int] = { id(node): i for i, node in enumerate(self.nodes) }
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getstate__(self) -> dict:
+        # id在另一个进程里没有意义，反序列化时重新生成
+        state = self.__dict__.copy()
+        del state['index_of']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.index_of = { id(node): i for i, node in enumerate(self.nodes) }
+
+    def attach(self) -> None:
+        """让节点的计数写到表里，节点原有的计数会被保留"""
+        for i, node in enumerate(self.nodes):
+            counters = node.__dict__.get('counters')
+            if counters is not None:
+                self.data[i] = counters
+            node.counters = self.data[i]
+
+    def reset(self) -> None:
+        self.data.fill(0)
+
+    def row(self, node: py_trees.behaviour.Behaviour | int) -> typing.Dict[str, int]:
+        i = node if isinstance(node, int) else self.index_of[id(node)]
+        return dict(zip(COUNTER_KEYS, self.data[i].tolist()))
+
+    def totals(self) -> typing.Dict[str, int]:
+        """所有节点的计数之和"""
+        return dict(zip(COUNTER_KEYS, self.data.sum(axis=0).tolist()))
+
+    def to_json(self) -> dict:
+        return {
+            'keys'    : COUNTER_KEYS,
+            'serials' : [getattr(node, 'serial', None) for node in self.nodes],  # 不读node.id，避免为每个节点生成uuid
+            'counters': self.data.tolist(),
+        }
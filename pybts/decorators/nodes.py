@@ -5,6 +5,7 @@ import pybts
 from pybts.nodes import Node
 from abc import ABC
 from py_trees.common import Status
+from pybts.constants import BATCH_STATUS, COUNTER
 import typing
 
 
@@ -31,15 +32,27 @@ class Decorator(Node, ABC):
         Yields:
             a reference to itself or one of its children
         """
-        self.debug_info['tick_count'] += 1
-        self.logger.debug("%s.tick()" % self.__class__.__name__)
-        # initialise just like other behaviours/composites
-        if self.status != Status.RUNNING:
-            self.initialise()
+        self.enter_tick()
         # interrupt proceedings and process the child node
         # (including any children it may have as well)
         for node in self.decorated.tick():
             yield node
+        self.exit_tick()
+        yield self
+
+    def enter_tick(self) -> None:
+        """子节点tick之前的逻辑，tick和FlatEngine共用"""
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        if self.debug:
+            self.counters[COUNTER.TICK] += 1
+            self.logger.debug("%s.tick()" % self.__class__.__name__)
+        # initialise just like other behaviours/composites
+        if self.status != Status.RUNNING:
+            self.initialise()
+
+    def exit_tick(self) -> None:
+        """子节点tick之后的逻辑，tick和FlatEngine共用"""
         # resume normal proceedings for a Behaviour's tick
         new_status = self.update()
         if new_status not in list(Status):
@@ -51,7 +64,6 @@ class Decorator(Node, ABC):
         if new_status != Status.RUNNING:
             self.stop(new_status)
         self.status = new_status
-        yield self
 
     def stop(self, new_status: Status) -> None:
         """
@@ -60,7 +72,8 @@ class Decorator(Node, ABC):
         Args:
             new_status (:class:`~py_trees.Status`): the behaviour is transitioning to this new status
         """
-        self.logger.debug("%s.stop(%s)" % (self.__class__.__name__, new_status))
+        if self.debug:
+            self.logger.debug("%s.stop(%s)" % (self.__class__.__name__, new_status))
         self.terminate(new_status)
         # priority interrupt handling
         if new_status == Status.INVALID:
@@ -93,6 +106,8 @@ class Inverter(Decorator):
     - FAILURE: 子节点返回成功
     """
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.FAILURE, BATCH_STATUS.SUCCESS, BATCH_STATUS.RUNNING]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Flip :data:`~py_trees.Status.SUCCESS` and :data:`~py_trees.Status.FAILURE`.
@@ -239,6 +254,8 @@ class OneShot(Decorator):
         Yields:
             a reference to itself or a behaviour in it's child subtree
         """
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()  # 先reset再判断，否则会沿用上一轮的final_status
         if self.final_status:
             # ignore the child
             yield from Node.tick(self)
@@ -307,6 +324,11 @@ class Timeout(Decorator):
         """Reset the feedback message and finish time on behaviour entry."""
         self.finish_time = self.get_time(self.time) + self.duration
         self.feedback_message = ""
+        self.schedule_timer(self.finish_time)
+
+    def terminate(self, new_status: Status) -> None:
+        super().terminate(new_status)
+        self.cancel_timer()
 
     def update(self) -> Status:
         """
@@ -440,6 +462,8 @@ class Count(Decorator):
 class RunningIsFailure(Decorator):
     """Got to be snappy! We want results...yesterday."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.SUCCESS, BATCH_STATUS.FAILURE, BATCH_STATUS.FAILURE]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.RUNNING` as :data:`~py_trees.Status.FAILURE`.
@@ -462,6 +486,8 @@ class RunningIsFailure(Decorator):
 class RunningIsSuccess(Decorator):
     """Don't hang around..."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.SUCCESS, BATCH_STATUS.FAILURE, BATCH_STATUS.SUCCESS]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.RUNNING` as :data:`~py_trees.Status.SUCCESS`.
@@ -483,6 +509,8 @@ class RunningIsSuccess(Decorator):
 class FailureIsSuccess(Decorator):
     """Be positive, always succeed."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.SUCCESS, BATCH_STATUS.SUCCESS, BATCH_STATUS.RUNNING]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.FAILURE` as :data:`~py_trees.Status.SUCCESS`.
@@ -504,6 +532,8 @@ class FailureIsSuccess(Decorator):
 class FailureIsRunning(Decorator):
     """Dont stop running."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.SUCCESS, BATCH_STATUS.RUNNING, BATCH_STATUS.RUNNING]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.FAILURE` as :data:`~py_trees.Status.RUNNING`.
@@ -525,6 +555,8 @@ class FailureIsRunning(Decorator):
 class SuccessIsFailure(Decorator):
     """Be depressed, always fail."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.FAILURE, BATCH_STATUS.FAILURE, BATCH_STATUS.RUNNING]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.SUCCESS` as :data:`~py_trees.Status.FAILURE`.
@@ -546,6 +578,8 @@ class SuccessIsFailure(Decorator):
 class SuccessIsRunning(Decorator):
     """The tickling never ends..."""
 
+    batch_status_map = [BATCH_STATUS.INVALID, BATCH_STATUS.RUNNING, BATCH_STATUS.FAILURE, BATCH_STATUS.RUNNING]  # BatchTree中子节点状态到本节点状态的映射
+
     def update(self) -> Status:
         """
         Reflect :data:`~py_trees.Status.SUCCESS` as :data:`~py_trees.Status.RUNNING`.
@@ -571,6 +605,10 @@ class Throttle(Decorator):
     </Throttle>
     """
 
+    attr_types = {
+        'duration': 'float'
+    }
+
     def __init__(self, duration: float | str = 5.0, time: str | float = 'time', **kwargs):
         """
         Init with the decorated child and a timeout duration.
@@ -595,10 +633,13 @@ class Throttle(Decorator):
         return self.decorated.status
 
     def tick(self):
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()  # 先reset再判断，否则会用上一轮的last_time
         self.curr_time = self.get_time(self.time)
-        duration = self.converter.float(self.duration)
+        duration = self.param('duration')
         if self.curr_time - self.last_time >= duration:
             self.last_time = self.curr_time
+            self.schedule_timer(self.curr_time + duration)
             yield from Decorator.tick(self)
         else:
             yield from Node.tick(self)
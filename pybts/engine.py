@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import typing
+
+import py_trees
+from py_trees.common import Status
+
+from pybts.constants import COUNTER
+
+from pybts.nodes import Node
+from pybts.composites import *
+from pybts.decorators import Decorator
+
+
+class OPCODE:
+    # 扁平化执行时每个节点的操作码
+    GENERIC = 0  # 无法展开的节点，直接消费node.tick()生成器
+    LEAF = 1  # Node.tick
+    DECORATOR = 2  # Decorator.tick
+    SEQ_SEL = 3  # Sequence/Selector系列
+    PARALLEL = 4  # Parallel.tick
+    COND_BRANCH = 5  # CondBranch.tick
+    SWITCHER = 6  # Switcher系列
+
+
+_SEQUENCE_PARAMS = ([Status.SUCCESS], Status.SUCCESS)
+_SELECTOR_PARAMS = ([Status.FAILURE, Status.INVALID], Status.FAILURE)
+
+# tick函数 -> (操作码, 计算tick_again_status的函数, 其他参数)
+# 只有tick函数和下面完全一致的节点才会被展开，重写了tick的自定义节点一律按GENERIC处理
+_TICK_OPCODES = {
+    Node.tick              : (OPCODE.LEAF, None, None),
+    Decorator.tick         : (OPCODE.DECORATOR, None, None),
+    Sequence.tick          : (OPCODE.SEQ_SEL, lambda node: node.tick_again_status(), _SEQUENCE_PARAMS),
+    SequenceWithMemory.tick: (OPCODE.SEQ_SEL, lambda node: [Status.RUNNING, Status.FAILURE], _SEQUENCE_PARAMS),
+    ReactiveSequence.tick  : (OPCODE.SEQ_SEL, lambda node: [], _SEQUENCE_PARAMS),
+    Selector.tick          : (OPCODE.SEQ_SEL, lambda node: node.tick_again_status(), _SELECTOR_PARAMS),
+    SelectorWithMemory.tick: (OPCODE.SEQ_SEL, lambda node: [Status.SUCCESS, Status.RUNNING], _SELECTOR_PARAMS),
+    ReactiveSelector.tick  : (OPCODE.SEQ_SEL, lambda node: [], _SELECTOR_PARAMS),
+    Parallel.tick          : (OPCODE.PARALLEL, None, None),
+    CondBranch.tick        : (OPCODE.COND_BRANCH, None, None),
+    Switcher.tick          : (OPCODE.SWITCHER, lambda node: node.tick_again_status(), None),
+    ReactiveSwitcher.tick  : (OPCODE.SWITCHER, lambda node: [], None),
+}
+
+
+def supports_lazy_reset(node: py_trees.behaviour.Behaviour) -> bool:
+    """
+    节点能否延迟reset（参考Node.lazy_reset）：tick函数是上面这些公共实现之一，第一次被tick时一定会经过sync_epoch
+    重写了tick的节点（和FlatEngine按GENERIC处理的节点相同）不一定会调用sync_epoch，由Tree.reset立即reset
+    """
+    return getattr(node, 'lazy_reset', False) and type(node).tick in _TICK_OPCODES
+
+
+class FlatEngine:
+    """
+    扁平化的tick执行器
+
+    将setup之后的树按层序（BFS）展开成数组，同一个节点的子节点在数组中是连续的，
+    通过 child_start[i]:child_end[i] 即可拿到子节点下标，parent[i] 为父节点下标（根节点为-1）。
+    每个节点根据自己的tick函数分配一个操作码，tick时用普通的函数调用代替嵌套的生成器，
+    节点的initialise/update/stop/terminate等回调和生成器版本完全一致，所以得到的状态也完全一致。
+
+    运行前沿（resume=True）：
+    Sequence/Selector/Switcher在RUNNING时会直接重新执行当前子节点，非reactive的CondBranch也一样，
+    子节点仍然是RUNNING的话，这些节点除了把状态保持为RUNNING之外什么都不做（对它们来说是透明的）。
+    每帧结束后记录从根节点出发、沿着这些透明节点一直往下走到的RUNNING节点（运行前沿），
+    下一帧直接从运行前沿开始执行，只有状态发生变化时才把结果逐层交给父节点继续处理（参考各个处理函数的ticked参数）。
+    跳过的祖先节点仍然会累加tick计数，但不会输出它们的tick日志。
+
+    注意：
+    - 重写了tick的自定义节点会退化成GENERIC，直接消费它自己的tick()生成器
+    - setup之后如果修改了树的结构（增删子节点），需要调用Tree.compile()重新编译
+    """
+
+    def __init__(self, root: py_trees.behaviour.Behaviour, resume: bool = True):
+        self.root = root
+        self.resume = resume
+        self.frontier: typing.Optional[typing.List[int]] = None  # 从根节点到运行前沿的下标
+        self.nodes: typing.List[py_trees.behaviour.Behaviour] = []
+        self.parent: typing.List[int] = []
+        self.child_start: typing.List[int] = []
+        self.child_end: typing.List[int] = []
+        self.opcodes: typing.List[int] = []
+        self.tick_again: typing.List[typing.Optional[typing.Callable]] = []
+        self.params: typing.List[typing.Any] = []
+        self.index_of: typing.Dict[int, int] = { }  # id(node) -> 下标
+        self.compile()
+
+    def compile(self):
+        self.nodes = [self.root]
+        self.parent = [-1]
+        i = 0
+        while i < len(self.nodes):
+            node = self.nodes[i]
+            for child in node.children:
+                self.nodes.append(child)
+                self.parent.append(i)
+            i += 1
+
+        self.index_of = { id(node): i for i, node in enumerate(self.nodes) }
+        self.child_start = []
+        self.child_end = []
+        self.opcodes = []
+        self.tick_again = []
+        self.params = []
+        offset = 1
+        for node in self.nodes:
+            self.child_start.append(offset)
+            offset += len(node.children)
+            self.child_end.append(offset)
+            opcode, tick_again, params = _TICK_OPCODES.get(type(node).tick, (OPCODE.GENERIC, None, None))
+            if opcode == OPCODE.DECORATOR and len(node.children) == 0:
+                opcode = OPCODE.GENERIC
+            elif opcode == OPCODE.SEQ_SEL and node.commutative:
+                # 会重排子节点，不能按固定的展开顺序执行
+                opcode = OPCODE.GENERIC
+            self.opcodes.append(opcode)
+            self.tick_again.append(tick_again)
+            self.params.append(params)
+        self._build_dispatch()
+
+    def _build_dispatch(self):
+        self._handlers = {
+            OPCODE.GENERIC    : self._generic,
+            OPCODE.LEAF       : self._leaf,
+            OPCODE.DECORATOR  : self._decorator,
+            OPCODE.SEQ_SEL    : self._seq_sel,
+            OPCODE.PARALLEL   : self._parallel,
+            OPCODE.COND_BRANCH: self._cond_branch,
+            OPCODE.SWITCHER   : self._switcher,
+        }
+        self._dispatch = [self._handlers[opcode] for opcode in self.opcodes]
+        for i, node in enumerate(self.nodes):
+            if getattr(node, 'priority', None) is not None:
+                self._dispatch[i] = self._prioritized(self._dispatch[i])
+
+    def instantiate(self, root: py_trees.behaviour.Behaviour,
+                    clones: typing.Dict[py_trees.behaviour.Behaviour, py_trees.behaviour.Behaviour]) -> 'FlatEngine':
+        """
+        结构完全相同的另一棵树（参考pybts.prototype.TreePrototype）使用的执行器：
+        共用编译好的数组（parent、child_start、opcodes等），只替换节点，不需要重新编译
+        clones: 本树的节点 -> 另一棵树中对应的节点
+        """
+        engine = object.__new__(FlatEngine)
+        engine.__dict__.update(self.__dict__)
+        engine.root = root
+        engine.frontier = None
+        engine.nodes = [clones[node] for node in self.nodes]
+        engine.index_of = { id(node): i for i, node in enumerate(engine.nodes) }
+        engine._build_dispatch()
+        return engine
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def tick(self) -> Status:
+        if not self.resume:
+            self._dispatch[0](0)
+            return self.root.status
+
+        if not self._resume_frontier():
+            self._dispatch[0](0)
+        self.frontier = self._find_frontier()
+        return self.root.status
+
+    def _is_transparent(self, i: int) -> bool:
+        """RUNNING的节点i在下一帧是否只会重新执行当前子节点"""
+        node = self.nodes[i]
+        opcode = self.opcodes[i]
+        if getattr(node, 'priority', None) is not None:
+            # 带优先级的节点每帧都要判断是否跳过，运行前沿不能越过它
+            return False
+        if opcode == OPCODE.SEQ_SEL or opcode == OPCODE.SWITCHER:
+            return Status.RUNNING in self.tick_again[i](node)
+        elif opcode == OPCODE.COND_BRANCH:
+            return not node.reactive
+        return False
+
+    def _find_frontier(self) -> typing.Optional[typing.List[int]]:
+        nodes = self.nodes
+        if nodes[0].status != Status.RUNNING:
+            return None
+        chain = [0]
+        i = 0
+        while self._is_transparent(i):
+            current_index = nodes[i].current_index
+            if current_index is None:
+                break
+            child_index = self.child_start[i] + current_index
+            if nodes[child_index].status != Status.RUNNING:
+                break
+            i = child_index
+            chain.append(i)
+        if len(chain) == 1:
+            return None
+        return chain
+
+    def _resume_frontier(self) -> bool:
+        """从运行前沿开始执行，运行前沿失效（例如被reset或者从外部停止）时返回False"""
+        chain = self.frontier
+        if chain is None:
+            return False
+        nodes = self.nodes
+        for k in range(len(chain) - 1):
+            node = nodes[chain[k]]
+            if node.status != Status.RUNNING or node.current_index != chain[k + 1] - self.child_start[chain[k]] or \
+                    not self._is_transparent(chain[k]):
+                return False
+        if nodes[chain[-1]].status != Status.RUNNING:
+            return False
+
+        for k in range(len(chain) - 1):
+            node = nodes[chain[k]]
+            if node.debug and self.opcodes[chain[k]] != OPCODE.COND_BRANCH:  # CondBranch自身不计tick次数
+                node.counters[COUNTER.TICK] += 1
+
+        j = chain[-1]
+        self._dispatch[j](j)
+        k = len(chain) - 1
+        while k > 0 and nodes[j].status != Status.RUNNING:
+            # 状态发生了变化，交给父节点继续处理
+            k -= 1
+            parent = chain[k]
+            self._dispatch[parent](parent, j)
+            j = parent
+        return True
+
+    def _prioritized(self, handler: typing.Callable) -> typing.Callable:
+        """带优先级的节点：需要降载时跳过整个子树（参考Node.priority）"""
+
+        def dispatch(i: int, *args):
+            node = self.nodes[i]
+            if node.should_shed():
+                node.shed()
+            else:
+                handler(i, *args)
+
+        return dispatch
+
+    def _generic(self, i: int):
+        for _ in self.nodes[i].tick():
+            pass
+
+    def _leaf(self, i: int):
+        self.nodes[i].leaf_tick()
+
+    def _decorator(self, i: int):
+        node = self.nodes[i]
+        node.enter_tick()
+        k = self.child_start[i]
+        self._dispatch[k](k)
+        node.exit_tick()
+
+    def _seq_sel(self, i: int, ticked: int = -1):
+        """ticked: 本帧已经执行过的子节点下标（从运行前沿返回时），-1表示正常执行"""
+        node = self.nodes[i]
+        if node.epoch != node._tick_state.epoch:
+            node.sync_epoch()
+        continue_status, no_child_status = self.params[i]
+        if node.debug and ticked < 0:
+            node.counters[COUNTER.TICK] += 1
+            node.logger.debug("%s.tick()" % (node.__class__.__name__))
+
+        nodes = self.nodes
+        start, end = self.child_start[i], self.child_end[i]
+        if ticked >= 0:
+            k = ticked
+        elif node.status in self.tick_again[i](node):
+            # 重新执行上次执行的子节点
+            assert node.current_index is not None
+            k = start + node.current_index
+        else:
+            node.current_index = None  # 从头执行
+            k = start + node.gen_index()
+
+        while k < end:
+            child = nodes[k]
+            node.current_index = k - start
+            if k != ticked:
+                node.activate(k - start)
+                self._dispatch[k](k)
+            if child.status not in continue_status:
+                break
+            k += 1
+
+        if node.current_index is not None:
+            current_index = node.current_index
+            new_status = nodes[start + current_index].status
+            # 剩余的（被tick过的）子节点全部停止
+            node.stop_active_after(current_index)
+        else:
+            new_status = no_child_status
+
+        if new_status != Status.RUNNING:
+            node.stop(new_status)
+        node.status = new_status
+
+    def _parallel(self, i: int):
+        node = self.nodes[i]
+        if node.epoch != node._tick_state.epoch:
+            node.sync_epoch()
+        if node.debug:
+            node.counters[COUNTER.TICK] += 1
+            node.logger.debug("%s.tick()" % (node.__class__.__name__))
+
+        node.current_index = None
+        nodes = self.nodes
+        start, end = self.child_start[i], self.child_end[i]
+        for k in range(start, end):
+            node.current_index = k - start
+            self._dispatch[k](k)
+
+        running_count = 0
+        success_count = 0
+        for k in range(start, end):
+            status = nodes[k].status
+            if status == Status.RUNNING:
+                running_count += 1
+            elif status == Status.SUCCESS:
+                success_count += 1
+
+        success_threshold = node.success_threshold
+        if success_threshold == -1:
+            success_threshold = end - start
+        if running_count > 0:
+            new_status = Status.RUNNING
+        elif success_count >= success_threshold:
+            new_status = Status.SUCCESS
+        else:
+            new_status = Status.FAILURE
+
+        if new_status != Status.RUNNING:
+            node.stop(new_status)
+        node.status = new_status
+
+    def _cond_branch(self, i: int, ticked: int = -1):
+        node = self.nodes[i]
+        if node.epoch != node._tick_state.epoch:
+            node.sync_epoch()
+        if node.reactive:
+            tick_again_status = []
+        elif node.memory:
+            tick_again_status = [Status.RUNNING, Status.FAILURE]
+        else:
+            tick_again_status = [Status.RUNNING]
+
+        nodes = self.nodes
+        start, end = self.child_start[i], self.child_end[i]
+        current_index = node.current_index
+
+        if (ticked > start) or (ticked < 0 and node.status in tick_again_status and current_index != 0):
+            assert current_index is not None
+            # 重新执行上次执行的动作节点
+            if ticked < 0:
+                node.activate(current_index)
+                self._dispatch[start + current_index](start + current_index)
+            new_status = nodes[start + current_index].status
+            if new_status != Status.RUNNING:
+                node.stop(new_status)
+            node.status = new_status
+            return
+
+        condition = nodes[start]
+        node.current_index = 0
+        if ticked != start:
+            node.activate(0)
+            self._dispatch[start](start)
+
+        if condition.status == Status.RUNNING:
+            node.status = Status.RUNNING
+            return
+
+        if condition.status == Status.SUCCESS:
+            # 执行第1个节点
+            k = start + 1
+        elif condition.status == Status.FAILURE:
+            # 执行第2个节点（如果第二个节点存在的话）
+            k = start + 2 if end - start == 3 else -1
+        else:
+            k = start
+        current_index = node.current_index = k - start if k >= 0 else None
+        # 停止其他节点
+        node.stop_active_children(keep=lambda j: j == 0 or j == current_index)
+
+        if k >= 0:
+            node.activate(current_index)
+            self._dispatch[k](k)
+            new_status = nodes[k].status
+        else:
+            new_status = condition.status
+        if new_status != Status.RUNNING:
+            node.stop(new_status)
+        node.status = new_status
+
+    def _switcher(self, i: int, ticked: int = -1):
+        node = self.nodes[i]
+        if node.epoch != node._tick_state.epoch:
+            node.sync_epoch()
+        if node.debug and ticked < 0:
+            node.counters[COUNTER.TICK] += 1
+            node.logger.debug("%s.tick()" % (node.__class__.__name__))
+
+        start, end = self.child_start[i], self.child_end[i]
+        if ticked >= 0 or node.status in self.tick_again[i](node):
+            # 重新执行上次执行的子节点
+            assert node.current_index is not None
+        else:
+            index = node.gen_index()
+            if index is None:
+                # 没有需要执行的子节点（例如Dispatch没有匹配的子节点）
+                node.current_index = None
+                node.stop_active_children(keep=lambda j: False)
+                node.stop(Status.FAILURE)
+                node.status = Status.FAILURE
+                return
+            node.children[index]  # 越界时抛出IndexError
+            node.current_index = index % (end - start)
+
+        current_index = node.current_index
+        k = start + current_index
+        if k != ticked:
+            node.activate(current_index)
+            self._dispatch[k](k)
+        node.stop_active_children(keep=lambda j: j == current_index)
+
+        new_status = self.nodes[k].status
+        if new_status != Status.RUNNING:
+            node.stop(new_status)
+        node.status = new_status
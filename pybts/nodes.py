@@ -1,5 +1,7 @@
 from __future__ import annotations
-from abc import ABC
+from abc import ABC, abstractmethod
+import asyncio
+import concurrent.futures
 from queue import Queue
 
 from py_trees import behaviour, common
@@ -8,8 +10,63 @@ from py_trees.behaviour import Behaviour
 from pybts.constants import *
 import typing
 import py_trees
+import functools
 import itertools
+import math
 import random
+import re
+import time
+import uuid
+import numpy as np
+from pybts.converter import Converter, Binding
+from pybts.context import Context
+
+_ATTR_TYPES_CACHE: typing.Dict[type, typing.Dict[str, str]] = { }
+_UNBOUND = object()
+_SERIALS = itertools.count()
+# 表达式和模版里可以直接使用、但是不来自context的非确定性的值（参考Converter.eval），参数用到它们的节点不能作为纯条件节点
+_IMPURE_NAMES = re.compile(r'\brandom\b')
+_NAME_REF = re.compile(r'\bname\b')  # 表达式中可以直接使用节点的name
+
+
+class TickState:
+    """
+    树和它的所有节点共用的状态，在Tree.setup时交给每个节点
+    - epoch: reset的次数，节点据此延迟reset（参考Tree.reset）
+    - shed_below: 优先级低于它的节点直接跳过（参考Node.priority）
+    - deadline: 这一帧开始降载的时间点（time.perf_counter），到了之后跳过优先级为负数的节点
+    - clock: 树的时钟（pybts.clock.Clock），每帧读取一次
+    - timers: 定时器（pybts.clock.TimerWheel），和时间有关的节点在这里登记下一次结果可能变化的时间
+    """
+    __slots__ = ('epoch', 'shed_below', 'deadline', 'clock', 'timers')
+
+    def __init__(self):
+        self.epoch = 0
+        self.shed_below = -math.inf
+        self.deadline = math.inf
+        self.clock = None
+        self.timers = None
+
+
+_DETACHED_STATE = TickState()  # 不属于任何树的节点共用的状态，永远不会变化
+
+
+def with_priority(tick: typing.Callable) -> typing.Callable:
+    """
+    包装节点的tick：带优先级的节点先判断这一帧是否需要跳过（参考Node.priority）
+    Node的子类重写的tick会在定义类时自动包装，没有优先级的节点只多一次属性判断，不多一层生成器
+    """
+    if getattr(tick, 'with_priority', False):
+        return tick
+
+    @functools.wraps(tick)
+    def wrapper(self) -> typing.Iterator[Behaviour]:
+        if self.priority is not None and self.should_shed():
+            return self.shed_tick()
+        return tick(self)
+
+    wrapper.with_priority = True
+    return wrapper
 
 
 class Node(py_trees.behaviour.Behaviour, ABC):
@@ -33,69 +90,281 @@ class Node(py_trees.behaviour.Behaviour, ABC):
     update
     """
 
+    # 参数类型声明，setup时会按照类型预编译参数（参考Binding），子类的声明会和父类合并
+    attr_types: typing.Dict[str, str] = { }
+
+    # 纯条件节点：没有副作用，结果只取决于它从context读取的值。
+    # context是Context时，如果上一次update读取过的key都没有被写过，直接沿用上一次的SUCCESS/FAILURE，不再执行update
+    # 继承了纯条件节点但是有副作用（或者依赖时间、随机数等context之外的值）的子类需要设置为False
+    # 类和参数都相同的纯条件节点（例如多处出现的同一个IsMatchRule）还会通过Context.pure_results共用同一次计算
+    pure: bool = False
+
+    # 不可变的默认值放在类上，实例只有在修改时才会占用自己的__dict__
+    status: Status = Status.INVALID
+    parent: typing.Optional[py_trees.behaviour.Behaviour] = None
+    feedback_message: str = ''
+    blackbox_level = common.BlackBoxLevel.NOT_A_BLACKBOX
+    reset_count: int = 0
+    _updater_iter = None
+    _memo = None  # 纯条件节点上一次的结果：(context版本, 读取的key, 状态)
+    _pure_key = None  # 纯条件节点共用结果的key，在setup时生成，None表示不共用
+    _bindings_shared = False  # bindings是否和其他节点共用（参考TreePrototype），共用时bind先复制再写入
+
+    # 延迟reset：Tree.reset只把树的epoch加1，节点在新的epoch里第一次被tick时才执行自己的reset（参考Tree.reset）
+    # 重写了tick的节点在Tree.setup时自动改为立即reset（参考pybts.engine.supports_lazy_reset），
+    # 没有重写tick、但是reset时需要马上清理外部状态的节点（例如强化学习节点）设置为False
+    lazy_reset: bool = True
+    epoch: int = 0  # 节点最后一次reset时所在的epoch
+    _tick_state: TickState = _DETACHED_STATE  # 所在的树的共用状态，在Tree.setup时设置
+
+    # 优先级：在xml/参数中写了priority的节点才有，默认的节点没有优先级，永远不会被跳过
+    # 树降载时（Tree.shed_below，或者有时间预算的tick快要超时）优先级低的整个子树不执行，直接返回shed_status，并计入shed_count
+    # 一般把装饰性的行为设置为负数优先级，超时前才会被跳过
+    priority: typing.Optional[int] = None
+    shed_status: Status = Status.FAILURE
+    shed_count: int = 0
+
+    # 延迟创建的属性：第一次读取时才创建并保存到实例上，之后的读取和普通属性一样
+    # 大部分节点在运行时用不到py_trees的logger、uuid、blackboards等，树很大时可以省下不少内存
+    _LAZY_ATTRS: typing.Dict[str, typing.Callable[['Node'], typing.Any]] = {
+        'id'            : lambda node: uuid.uuid4(),
+        'logger'        : lambda node: py_trees.logging.Logger(node.name),
+        'iterator'      : lambda node: node.tick(),
+        'blackboards'   : lambda node: [],
+        'qualified_name': lambda node: f'{node.__class__.__qualname__}/{node.name}',
+        'counters'      : lambda node: np.zeros(len(COUNTER_KEYS), dtype=np.int64),  # Tree.setup时会换成CounterTable中的一行
+    }
+
     def __init__(self, name: str = '', children: typing.List[py_trees.behaviour.Behaviour] = None, **kwargs):
-        self.attrs: typing.Dict[str, typing.AnyStr] = kwargs or { }  # 在builder和xml中传递的参数，会在__init__之后提供一个更完整的
+        # 不调用Behaviour.__init__，它创建的属性改为类上的默认值或者延迟创建（参考_LAZY_ATTRS）
+        name = name or self.__class__.__name__
+        if not isinstance(name, str):
+            raise TypeError(f'a behaviour name should be a string, but you passed in {type(name)}')
+        self.name = name
+        self.serial = next(_SERIALS)  # 进程内唯一的整数编号，比uuid更省内存，uuid（self.id）在第一次读取时才生成
+        self.attrs: typing.Dict[str, typing.AnyStr] = kwargs  # 在builder和xml中传递的参数，会在__init__之后提供一个更完整的
         self.context: typing.Optional[dict] = None  # 共享的字典，在tree.setup的时候提供，所以不要在__init__的时候修改或使用它，而是在setup的时候使用
-        super().__init__(name=name or self.__class__.__name__)
-        self._updater_iter = None
-        self.debug_info = {
-            'tick_count'      : 0,
-            'update_count'    : 0,
-            'terminate_count' : 0,
-            'initialise_count': 0,
-            'success_count'   : 0,
-            'failure_count'   : 0,
-            'invalid_count'   : 0,
-            'running_count'   : 0
-        }
-        self.reset_count = 0
+        self.bindings: typing.Dict[str, Binding] = { }  # 预编译的参数，在setup时生成
+        self.debug = True  # 调试模式：记录debug_info计数并输出debug日志，Tree.setup(mode='lean')时关闭以减少每帧的开销
+        # setup时才会赋值的属性也要在这里先声明，否则实例会从紧凑布局退化成普通的__dict__
+        self._converter: typing.Optional[Converter] = None
+        self.epoch = 0
+        self._tick_state = _DETACHED_STATE
         if children is not None:
             self.children = children
             for child in children:
                 child.parent = self
+        else:
+            self.children = []
+
+    def __init_subclass__(cls, **kwargs: typing.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if 'tick' in cls.__dict__:
+            cls.tick = with_priority(cls.__dict__['tick'])
+
+    def __getattr__(self, key: str) -> typing.Any:
+        # 只有在正常的属性查找失败时才会调用
+        factory = type(self)._LAZY_ATTRS.get(key)
+        if factory is None:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
+        value = factory(self)
+        self.__dict__[key] = value
+        return value
+
+    # pickle时不保存的属性：延迟创建的logger/iterator（需要时重新创建）、执行到一半的updater（生成器无法pickle）、
+    # 纯条件节点的缓存（反序列化后Context的版本号从0开始，旧的缓存会误判）
+    _TRANSIENT_ATTRS = frozenset({ 'logger', 'iterator', '_updater_iter', '_memo' })
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        """
+        setup好的节点（树）可以直接pickle，例如发送到multiprocessing的子进程，不需要在每个进程里用Builder重新构建
+        _TRANSIENT_ATTRS在反序列化后重新创建，执行到一半的updater会从头开始
+        """
+        state = self.__dict__.copy()
+        for key in self._TRANSIENT_ATTRS:
+            state.pop(key, None)
+        if state.get('_converter') is not None:
+            state['_converter'] = None  # 第一次使用时重新创建
+        counters = state.get('counters')
+        if counters is not None and counters.base is not None:
+            del state['counters']  # CounterTable中的一行，反序列化时由CounterTable重新绑定
+        if state.get('_tick_state') is _DETACHED_STATE:
+            del state['_tick_state']
+        return state
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        self.__dict__.update(state)
+        self.serial = next(_SERIALS)  # 编号只在进程内唯一，重新分配
 
     def setup(self, **kwargs: typing.Any) -> None:
         super().setup(**kwargs)
         self.name = self.converter.render(self.name)
+        self.bindings.clear()
+        for key in itertools.chain(self.get_attr_types(), self.attrs):
+            if key not in self.bindings:
+                self.bind(key)
+        if self.pure and self.reads_outside_context():
+            self.pure = False
+        if self.pure:
+            self._pure_key = self.make_pure_key()
+        if 'priority' in self.attrs:
+            self.priority = self.converter.int(self.attrs['priority'])
+            self.shed_status = self.converter.status(self.attrs.get('shed_status', Status.FAILURE))
+            assert self.shed_status in (Status.SUCCESS, Status.FAILURE), \
+                f'{self.name}: shed_status should be SUCCESS or FAILURE'
+
+    def should_shed(self) -> bool:
+        """这一帧是否需要跳过（只对带优先级的节点有意义）"""
+        state = self._tick_state
+        return self.priority < state.shed_below or (self.priority < 0 and time.perf_counter() >= state.deadline)
+
+    def shed(self) -> None:
+        """跳过这一帧：正在运行的子树会被停止，状态直接设置为shed_status"""
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        self.shed_count += 1
+        if self.status == Status.RUNNING:
+            self.stop(Status.INVALID)
+        self.status = self.shed_status
+
+    def shed_tick(self) -> typing.Iterator[Behaviour]:
+        """跳过这一帧时代替tick（参考with_priority）"""
+        self.shed()
+        yield self
+
+    def reads_outside_context(self) -> bool:
+        """参数里是否用到了不来自context的值（例如 random.random() < 0.5），这样的节点每次的结果都可能不同"""
+        return any(isinstance(binding.source, str) and _IMPURE_NAMES.search(binding.source)
+                   for binding in self.bindings.values() if binding is not None)
+
+    def make_pure_key(self) -> typing.Optional[tuple]:
+        """
+        纯条件节点共用结果的key：类 + 每个参数的来源（模版原文，而不是渲染后的值，渲染正是想省掉的开销）
+        来源相同的两个节点读取同样的context会得到同样的结果，context有没有变化由依赖追踪判断
+        name不来自context，只有参数里用到了name时才放进key
+        参数不可哈希时返回None，不参与共用
+        """
+        uses_name = any(isinstance(binding.source, str) and _NAME_REF.search(binding.source)
+                        for binding in self.bindings.values() if binding is not None)
+        sources = [('name', self.name)] if uses_name else []
+        for key in sorted(set(self.get_attr_types()) | set(self.attrs)):
+            if key == 'name':
+                continue
+            if key in self.__dict__:
+                sources.append((key, self.__dict__[key]))
+            elif key in self.attrs:
+                sources.append((key, self.attrs[key]))
+        pure_key = (type(self), tuple(sources))
+        try:
+            hash(pure_key)
+        except TypeError:
+            return None
+        return pure_key
+
+    @classmethod
+    def get_attr_types(cls) -> typing.Dict[str, str]:
+        """合并父类声明的参数类型"""
+        attr_types = _ATTR_TYPES_CACHE.get(cls)
+        if attr_types is None:
+            attr_types = { }
+            for klass in reversed(cls.__mro__):
+                attr_types.update(klass.__dict__.get('attr_types', { }))
+            _ATTR_TYPES_CACHE[cls] = attr_types
+        return attr_types
+
+    def bind(self, key: str) -> typing.Optional[Binding]:
+        """
+        预编译参数，节点自身的同名属性优先，其次是attrs
+        参数不存在时返回None
+        """
+        if key in self.__dict__:
+            binding = self.converter.bind(self.__dict__[key], self.get_attr_types().get(key, ''))
+        elif key in self.attrs:
+            binding = self.converter.bind(self.attrs[key], self.get_attr_types().get(key, ''))
+        else:
+            binding = None
+        if self._bindings_shared:
+            # 和模版树共用的定义不能修改，第一次写入时复制一份自己的
+            self.bindings = dict(self.bindings)
+            self._bindings_shared = False
+        self.bindings[key] = binding
+        return binding
+
+    def param(self, key: str, default: typing.Any = None) -> typing.Any:
+        """读取预编译的参数值"""
+        binding = self.bindings.get(key, _UNBOUND)
+        if binding is _UNBOUND:
+            binding = self.bind(key)
+        if binding is None:
+            return default
+        return binding(self.converter)
+
+    def sync_epoch(self) -> None:
+        """树reset之后第一次被tick时才真正reset，每个epoch最多reset一次"""
+        epoch = self._tick_state.epoch
+        if self.epoch != epoch:
+            skipped = epoch - self.epoch - 1  # 中间几轮没有被tick过，只reset一次，reset_count要算上这几轮
+            if skipped > 0:
+                self.reset_count += skipped
+            self.epoch = epoch
+            self.reset()
 
     def reset(self):
         self.reset_count += 1
-        self.debug_info = {
-            'tick_count'      : 0,
-            'update_count'    : 0,
-            'terminate_count' : 0,
-            'initialise_count': 0,
-            'success_count'   : 0,
-            'failure_count'   : 0,
-            'invalid_count'   : 0,
-            'running_count'   : 0
-        }
+        counters = self.__dict__.get('counters')
+        if counters is not None and counters.base is None:
+            # 不属于任何CounterTable的节点自己清零，属于树的计数由Tree.reset统一清零；还没有计数（例如lean模式）时不需要创建
+            counters.fill(0)
         self._updater_iter = None
+        self._memo = None
+        if self.shed_count:
+            self.shed_count = 0
         if self.status != Status.INVALID:
             self.stop(Status.INVALID)
 
+    @property
+    def debug_info(self) -> typing.Dict[str, int]:
+        """
+        计数的字典形式，返回的是副本：node.debug_info['tick_count'] += 1 这样原地修改不会生效，请使用self.counters
+        """
+        return dict(zip(COUNTER_KEYS, self.counters.tolist()))
+
+    @debug_info.setter
+    def debug_info(self, value: typing.Dict[str, int]) -> None:
+        """整体赋值时按COUNTER_KEYS写入计数，没有的key清零"""
+        counters = self.counters
+        for i, key in enumerate(COUNTER_KEYS):
+            counters[i] = value.get(key, 0)
+
     @property
     def label(self):
-        if 'label' in self.attrs:
-            return self.converter.render(self.attrs['label'])
-        return self.name
+        return self.param('label', self.name)
 
     @property
-    def converter(self):
-        from pybts.converter import Converter
-        return Converter(self)
+    def converter(self) -> Converter:
+        converter = self._converter
+        if converter is None:
+            converter = self._converter = Converter(self)
+        return converter
 
     def to_data(self):
-        # 在board上查看的信息
-        return {
+        # 在board上查看的信息，延迟reset的节点先reset，不显示上一轮的状态
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        data = {
             'debug_info' : self.debug_info,
             'attrs'      : self.attrs,
             'reset_count': self.reset_count
         }
+        if self.priority is not None:
+            data['priority'] = self.priority
+            data['shed_count'] = self.shed_count
+        return data
 
     def update(self) -> Status:
-        self.logger.debug("%s.update()" % (self.__class__.__name__))
-        self.debug_info['update_count'] += 1
+        if self.debug:
+            self.logger.debug("%s.update()" % (self.__class__.__name__))
+            self.counters[COUNTER.UPDATE] += 1
         if self._updater_iter is None:
             self._updater_iter = self.updater()
         new_status = Status.INVALID
@@ -115,9 +384,22 @@ class Node(py_trees.behaviour.Behaviour, ABC):
         yield Status.INVALID
         return
 
+    @with_priority
     def tick(self) -> typing.Iterator[Behaviour]:
-        self.debug_info['tick_count'] += 1
-        self.logger.debug("%s.tick()" % (self.__class__.__name__))
+        self.leaf_tick()
+        yield self
+
+    def leaf_tick(self) -> None:
+        """叶子节点的tick逻辑（不产生生成器），tick和FlatEngine共用"""
+        if self.epoch != self._tick_state.epoch:
+            self.sync_epoch()
+        if self.debug:
+            self.counters[COUNTER.TICK] += 1
+            self.logger.debug("%s.tick()" % (self.__class__.__name__))
+
+        if self.pure and isinstance(self.context, Context):
+            self.pure_tick()
+            return
 
         if self.status != Status.RUNNING:
             # 开始的状态不是RUNNING
@@ -130,7 +412,45 @@ class Node(py_trees.behaviour.Behaviour, ABC):
             self.stop(new_status)
 
         self.status = new_status
-        yield self
+
+    def pure_tick(self) -> None:
+        """
+        纯条件节点的tick：依赖的key没有变化时沿用上一次的状态，否则记录这次update读取的key
+        自己的结果过期时，先看看相同的节点（pure_key相同）有没有算过还有效的结果
+        """
+        context: Context = self.context
+        memo = self._memo
+        if memo is not None and not context.changed_since(memo[0], memo[1]):
+            self.status = memo[2]
+            return
+
+        pure_key = self._pure_key
+        if pure_key is not None:
+            shared = context.pure_results.get(pure_key)
+            if shared is not None and not context.changed_since(shared[0], shared[1]):
+                self._memo = shared
+                if self.status == Status.RUNNING:
+                    self.stop(shared[2])
+                self.status = shared[2]
+                return
+
+        if self.status != Status.RUNNING:
+            self.initialise()
+        outer = context.track()
+        try:
+            new_status = self.update()
+        finally:
+            reads = context.untrack(outer)
+        assert isinstance(new_status, Status), f'{self.name}: {new_status} is not a valid status'
+        if new_status == Status.SUCCESS or new_status == Status.FAILURE:
+            self._memo = (context.version, reads, new_status)
+            if pure_key is not None:
+                context.pure_results[pure_key] = self._memo
+        else:
+            self._memo = None
+        if new_status != Status.RUNNING:
+            self.stop(new_status)
+        self.status = new_status
 
     def stop(self, new_status: Status) -> None:
         """
@@ -147,35 +467,39 @@ class Node(py_trees.behaviour.Behaviour, ABC):
            Users should not override this method to provide custom termination behaviour. The
            :meth:`~py_trees.behaviour.Behaviour.terminate` method has been provided for that purpose.
         """
-        self.logger.debug(
-                "%s.stop(%s)"
-                % (
-                    self.__class__.__name__,
-                    "%s->%s" % (self.status, new_status)
-                )
-        )
+        if self.debug:
+            self.logger.debug(
+                    "%s.stop(%s)"
+                    % (
+                        self.__class__.__name__,
+                        "%s->%s" % (self.status, new_status)
+                    )
+            )
         self.terminate(new_status)
         self.status = new_status
-        self.iterator = self.tick()
-        self.debug_info[new_status.value.lower() + '_count'] += 1
+        if self.debug:
+            self.iterator = self.tick()  # py_trees不会使用，只在调试模式下保持和py_trees一致
+            self.counters[STATUS_TO_COUNTER[new_status]] += 1
         if new_status == Status.INVALID:
             self._updater_iter = None  # 停止updater
 
     def terminate(self, new_status: common.Status) -> None:
         super().terminate(new_status)
-        self.logger.debug(
-                "%s.terminate(%s)"
-                % (
-                    self.__class__.__name__,
-                    "%s->%s" % (self.status, new_status)
-                )
-        )
-        self.debug_info['terminate_count'] += 1
+        if self.debug:
+            self.logger.debug(
+                    "%s.terminate(%s)"
+                    % (
+                        self.__class__.__name__,
+                        "%s->%s" % (self.status, new_status)
+                    )
+            )
+            self.counters[COUNTER.TERMINATE] += 1
 
     def initialise(self) -> None:
         super().initialise()
-        self.logger.debug("%s.initialise()" % (self.__class__.__name__))
-        self.debug_info['initialise_count'] += 1
+        if self.debug:
+            self.logger.debug("%s.initialise()" % (self.__class__.__name__))
+            self.counters[COUNTER.INITIALISE] += 1
 
     def __str__(self):
         attrs = {
@@ -193,30 +517,224 @@ class Node(py_trees.behaviour.Behaviour, ABC):
         return self.__str__()
 
     def get_time(self, time: str | float) -> float:
-        """获取行为树时间，时间可以由context传入，可以是一个函数"""
+        """
+        获取行为树时间，时间可以由context传入，可以是一个函数
+        和树的时钟来源相同时直接使用这一帧读取的时间（参考pybts.clock.Clock）
+        """
+        clock = self._tick_state.clock
+        if clock is not None and time == clock.source and clock.now is not None:
+            return clock.now
         if time == 'time':
             import time
             return time.monotonic()
         return self.converter.float(time)
 
+    def schedule_timer(self, deadline: float) -> None:
+        """登记下一次结果可能发生变化的时间（和get_time同一个时间单位），不在树里的节点忽略"""
+        timers = self._tick_state.timers
+        if timers is not None:
+            timers.schedule(self, deadline)
+
+    def cancel_timer(self) -> None:
+        timers = self._tick_state.timers
+        if timers is not None:
+            timers.cancel(self)
+
 
 class Action(Node, ABC):
     """
     行为节点
     """
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.actions = Queue()
+    _LAZY_ATTRS = {
+        **Node._LAZY_ATTRS,
+        'actions': lambda node: Queue(),  # 第一次使用时才创建
+    }
 
     def to_data(self):
         from pybts.utility import read_queue_without_destroying
-        actions = read_queue_without_destroying(self.actions)
+        actions = read_queue_without_destroying(self.actions) if 'actions' in self.__dict__ else []
         return {
             **super().to_data(),
             'actions': [str(act) for act in actions]
         }
 
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        state = super().__getstate__()
+        if 'actions' in state:
+            # Queue带有锁，不能pickle，只保存队列里的元素
+            from pybts.utility import read_queue_without_destroying
+            state['actions'] = read_queue_without_destroying(state['actions'])
+        return state
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        actions = state.pop('actions', None)
+        super().__setstate__(state)
+        if actions is not None:
+            for action in actions:
+                self.actions.put_nowait(action)
+
+
+class PendingAction(Action, ABC):
+    """
+    等待一个异步结果的行为节点，AsyncAction和FutureAction的公共部分
+
+    开始执行时调用start提交任务，得到的pending（asyncio.Task或者concurrent.futures.Future，
+    只用到done/cancelled/exception/result/cancel）完成之前返回RUNNING，完成之后的那一次tick返回on_result(结果)，
+    任务抛出的异常会在tick时重新抛出，被取消的任务返回FAILURE
+    被打断（stop(INVALID)）或者reset时取消任务
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pending: typing.Optional[typing.Union[asyncio.Task, concurrent.futures.Future]] = None
+
+    @abstractmethod
+    def start(self) -> typing.Union[asyncio.Task, concurrent.futures.Future]:
+        """提交任务"""
+        raise NotImplementedError
+
+    def on_result(self, result: typing.Any) -> Status:
+        """任务完成后（在树的线程里）把结果转换成状态"""
+        return result
+
+    def update(self) -> Status:
+        if self.debug:
+            self.logger.debug("%s.update()" % (self.__class__.__name__))
+            self.counters[COUNTER.UPDATE] += 1
+        if self.pending is None:
+            self.pending = self.start()
+        if not self.pending.done():
+            return Status.RUNNING
+
+        pending, self.pending = self.pending, None
+        if pending.cancelled():
+            return Status.FAILURE
+        exception = pending.exception()
+        if exception is not None:
+            raise exception
+        new_status = self.on_result(pending.result())
+        assert isinstance(new_status, Status), f'{self.name}: {new_status} is not a valid status'
+        return new_status
+
+    def cancel_pending(self) -> None:
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+
+    def terminate(self, new_status: Status) -> None:
+        super().terminate(new_status)
+        if new_status == Status.INVALID:
+            self.cancel_pending()
+
+    def reset(self):
+        super().reset()
+        self.cancel_pending()
+
+    def to_data(self):
+        return {
+            **super().to_data(),
+            'pending': None if self.pending is None else repr(self.pending)
+        }
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # 任务属于原来的事件循环或者executor，反序列化后正在运行的节点会重新提交
+        return { **super().__getstate__(), 'pending': None }
+
+
+class AsyncAction(PendingAction, ABC):
+    """
+    异步行为节点：在async_update里可以await其他协程（例如请求路径规划、仿真器等本地服务），不会阻塞整棵树
+
+    开始执行时把async_update作为任务提交到正在运行的事件循环，其他行为参考PendingAction
+    需要在事件循环里tick（Tree.tick_async/Tree.run_async）
+
+    class PlanPath(AsyncAction):
+        async def async_update(self) -> Status:
+            path = await planner.plan(self.context['start'], self.context['goal'])
+            self.context['path'] = path
+            return Status.SUCCESS if path else Status.FAILURE
+    """
+
+    @property
+    def task(self) -> typing.Optional[asyncio.Task]:
+        return self.pending
+
+    @abstractmethod
+    async def async_update(self) -> Status:
+        raise NotImplementedError
+
+    def start(self) -> asyncio.Task:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise Exception(f'{self.name}: AsyncAction needs a running event loop, use Tree.tick_async/run_async')
+        return loop.create_task(self.async_update())
+
+
+class FutureAction(PendingAction, ABC):
+    """
+    在executor（concurrent.futures的线程池/进程池）里执行耗时计算的行为节点，例如视线、寻路查询，计算期间不会卡住整棵树
+
+    开始执行（initialise）时把compute(*compute_args())提交到executor，其他行为参考PendingAction
+    已经开始执行的计算无法中断，取消时结果会被丢弃
+
+    executor: 不传时使用所有FutureAction共用的线程池（FutureAction.shared_executor()）
+    使用进程池时compute和它的参数需要可以pickle，所以compute是静态方法，需要的数据在compute_args里从context读取
+
+    class LineOfSight(FutureAction):
+        @staticmethod
+        def compute(grid, start, end) -> bool:
+            ...
+
+        def compute_args(self) -> tuple:
+            return self.context['grid'], self.context['agent'], self.context['enemy']
+    """
+
+    _shared_executor: typing.Optional[concurrent.futures.Executor] = None
+
+    def __init__(self, executor: typing.Optional[concurrent.futures.Executor] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.executor = executor
+
+    @property
+    def future(self) -> typing.Optional[concurrent.futures.Future]:
+        return self.pending
+
+    @classmethod
+    def shared_executor(cls) -> concurrent.futures.Executor:
+        if FutureAction._shared_executor is None:
+            FutureAction._shared_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='pybts')
+        return FutureAction._shared_executor
+
+    @staticmethod
+    @abstractmethod
+    def compute(*args) -> typing.Any:
+        """在executor里执行的计算"""
+        raise NotImplementedError
+
+    def compute_args(self) -> tuple:
+        """提交时（在树的线程里）准备compute的参数"""
+        return ()
+
+    def on_result(self, result: typing.Any) -> Status:
+        """计算完成后（在树的线程里）把结果转换成状态，默认Status原样返回，其他值按真假返回SUCCESS/FAILURE"""
+        if isinstance(result, Status):
+            return result
+        return Status.SUCCESS if result else Status.FAILURE
+
+    def start(self) -> concurrent.futures.Future:
+        executor = self.executor or self.shared_executor()
+        return executor.submit(type(self).compute, *self.compute_args())
+
+    def initialise(self) -> None:
+        super().initialise()
+        self.pending = self.start()
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # executor不能pickle：反序列化后使用共用线程池，需要的话重新设置executor
+        return { **super().__getstate__(), 'executor': None }
+
 
 class Condition:
     """
@@ -244,6 +762,9 @@ class Success(Node, Condition):
         super().update()
         return Status.SUCCESS
 
+    def batch_update(self, batch, mask):
+        return np.full(len(mask), BATCH_STATUS.SUCCESS, dtype=np.int8)
+
     def stop(self, new_status: common.Status) -> None:
         super().stop(new_status)
 
@@ -257,6 +778,9 @@ class Failure(Node, Condition):
         super().update()
         return Status.FAILURE
 
+    def batch_update(self, batch, mask):
+        return np.full(len(mask), BATCH_STATUS.FAILURE, dtype=np.int8)
+
 
 class Running(Node, Condition):
     """Running Node"""
@@ -265,6 +789,9 @@ class Running(Node, Condition):
         super().update()
         return Status.RUNNING
 
+    def batch_update(self, batch, mask):
+        return np.full(len(mask), BATCH_STATUS.RUNNING, dtype=np.int8)
+
 
 class IsMatchRule(Node, Condition):
     """
@@ -274,16 +801,32 @@ class IsMatchRule(Node, Condition):
     - 花括号里定义的变量可以从context里找到
     """
 
+    attr_types = {
+        'rule': 'bool'
+    }
+    pure = True
+
     def __init__(self, rule: str, **kwargs):
         super().__init__(**kwargs)
         self.rule = rule
 
     def update(self) -> Status:
-        rule_value = eval(self.converter.render(self.rule))
+        rule_value = self.param('rule')
         if rule_value:
             return Status.SUCCESS
         return Status.FAILURE
 
+    def batch_update(self, batch, mask):
+        binding = self.bindings.get('rule') or self.bind('rule')
+        if binding.kind == Binding.CONSTANT:
+            return np.full(len(mask), BATCH_STATUS.SUCCESS if binding.value else BATCH_STATUS.FAILURE, dtype=np.int8)
+        # 模版和表达式依赖每个实例自己的context，只能逐个实例求值
+        new_status = np.full(len(mask), BATCH_STATUS.FAILURE, dtype=np.int8)
+        for n in np.flatnonzero(mask):
+            if binding(Converter(self, context=batch.contexts[n])):
+                new_status[n] = BATCH_STATUS.SUCCESS
+        return new_status
+
 
 class IsChanged(Node, Condition):
     """
@@ -331,13 +874,11 @@ class IsChanged(Node, Condition):
         if self.rule == '':
             return curr_value != last_value
         else:
-            rule = self.converter.render(self.rule)
-            is_changed_value = eval(rule, {
-                **(self.context or { }),
-                'curr_value'   : curr_value,
-                'last_value'   : last_value,
-                'changed_count': self.changed_count
-            })
+            is_changed_value = self.converter.evaluate(
+                    self.rule,
+                    curr_value=curr_value,
+                    last_value=last_value,
+                    changed_count=self.changed_count)
             assert isinstance(is_changed_value, bool), 'IsChanged: invalid rule'
             return is_changed_value
 
@@ -381,6 +922,12 @@ class IsEqual(Node, Condition):
     检查两个值是否相等，值本身可以从context中拿到
     """
 
+    attr_types = {
+        'a': 'str',
+        'b': 'str'
+    }
+    pure = True
+
     def __init__(self, a: str, b: str, **kwargs):
         super().__init__(**kwargs)
         self.a = a
@@ -402,27 +949,43 @@ class IsEqual(Node, Condition):
         self.curr_b = None
 
     def update(self):
-        self.curr_a = self.converter.render(self.a)
-        self.curr_b = self.converter.render(self.b)
+        self.curr_a = self.param('a')
+        self.curr_b = self.param('b')
         if self.curr_a == self.curr_b:
             return Status.SUCCESS
         else:
             return Status.FAILURE
 
+    def batch_update(self, batch, mask):
+        a = self.bindings.get('a') or self.bind('a')
+        b = self.bindings.get('b') or self.bind('b')
+        if a.kind == Binding.CONSTANT and b.kind == Binding.CONSTANT:
+            return np.full(len(mask), BATCH_STATUS.SUCCESS if a.value == b.value else BATCH_STATUS.FAILURE, dtype=np.int8)
+        new_status = np.full(len(mask), BATCH_STATUS.FAILURE, dtype=np.int8)
+        for n in np.flatnonzero(mask):
+            converter = Converter(self, context=batch.contexts[n])
+            if a(converter) == b(converter):
+                new_status[n] = BATCH_STATUS.SUCCESS
+        return new_status
+
 
 class Print(Action):
+    attr_types = {
+        'msg': 'str'
+    }
+
     def __init__(self, msg: str, **kwargs):
         super().__init__(**kwargs)
         self.msg = msg
 
     def update(self) -> Status:
-        print(self.converter.render(self.msg))
+        print(self.param('msg'))
         return Status.SUCCESS
 
     def to_data(self):
         return {
             **super().to_data(),
-            "msg": self.converter.render(self.msg)
+            "msg": self.param('msg')
         }
 
 
@@ -433,6 +996,11 @@ class RandomIntValue(Node):
     随机数范围: [low, high], including both end points.
     """
 
+    attr_types = {
+        'low' : 'int',
+        'high': 'int'
+    }
+
     def __init__(self, key: str, high: int | str, low: int | str = 0, **kwargs):
         super().__init__(**kwargs)
         self.high = high
@@ -445,8 +1013,8 @@ class RandomIntValue(Node):
         self.key = self.converter.render(self.key)
 
     def update(self) -> Status:
-        low = self.converter.int(self.low)
-        high = self.converter.int(self.high)
+        low = self.param('low')
+        high = self.param('high')
 
         self.value = random.randint(low, high)
         self.context[self.key] = self.value
@@ -467,6 +1035,11 @@ class RandomFloatValue(Node):
     随机数范围: [low, high), 不包括high
     """
 
+    attr_types = {
+        'low' : 'float',
+        'high': 'float'
+    }
+
     def __init__(self, key: str, high: float | str = 1, low: float | str = 0, **kwargs):
         super().__init__(**kwargs)
         self.high = high
@@ -479,8 +1052,8 @@ class RandomFloatValue(Node):
         self.key = self.converter.render(self.key)
 
     def update(self) -> Status:
-        low = self.converter.float(self.low)
-        high = self.converter.float(self.high)
+        low = self.param('low')
+        high = self.param('high')
 
         self.value = random.random() * (high - low) + low
         self.context[self.key] = self.value
@@ -499,6 +1072,10 @@ class RandomSuccess(Node, Condition):
     以一定概率成功，其他情况是失败
     """
 
+    attr_types = {
+        'prob': 'float'
+    }
+
     def __init__(self, prob: float | str = 0.5, **kwargs):
         super().__init__(**kwargs)
         self.prob = prob
@@ -511,14 +1088,29 @@ class RandomSuccess(Node, Condition):
         }
 
     def update(self) -> Status:
-        self.curr_prob = self.converter.float(self.prob)
+        self.curr_prob = self.param('prob')
         assert 0 <= self.curr_prob <= 1, "Probability must be between 0 and 1"
         if random.random() < self.curr_prob:
             return Status.SUCCESS
         return Status.FAILURE
 
+    def batch_update(self, batch, mask):
+        binding = self.bindings.get('prob') or self.bind('prob')
+        if binding.kind == Binding.CONSTANT:
+            prob = np.full(len(mask), binding.value)
+        else:
+            prob = np.zeros(len(mask))
+            for n in np.flatnonzero(mask):
+                prob[n] = binding(Converter(self, context=batch.contexts[n]))
+        assert ((0 <= prob) & (prob <= 1)).all(), "Probability must be between 0 and 1"
+        return np.where(np.random.random(len(mask)) < prob, BATCH_STATUS.SUCCESS, BATCH_STATUS.FAILURE).astype(np.int8)
+
 
 class SetValueToContext(Node):
+    attr_types = {
+        'value': 'str'
+    }
+
     def __init__(self, key: str, value: typing.Any, **kwargs):
         super().__init__(**kwargs)
         self.key = key
@@ -526,7 +1118,7 @@ class SetValueToContext(Node):
         self.curr_value = None
 
     def setup(self, **kwargs: typing.Any) -> None:
-        super().__init__(**kwargs)
+        super().setup(**kwargs)
         self.key = self.converter.render(self.key)
 
     def to_data(self):
@@ -537,7 +1129,7 @@ class SetValueToContext(Node):
         }
 
     def compute_curr_value(self) -> typing.Any:
-        return self.converter.render(self.value)
+        return self.param('value')
 
     def update(self) -> Status:
         self.curr_value = self.compute_curr_value()
@@ -546,13 +1138,15 @@ class SetValueToContext(Node):
 
 
 class SetIntToContext(SetValueToContext):
-    def compute_curr_value(self) -> typing.Any:
-        return self.converter.int(self.value)
+    attr_types = {
+        'value': 'int'
+    }
 
 
 class SetFloatToContext(SetValueToContext):
-    def compute_curr_value(self) -> typing.Any:
-        return self.converter.float(self.value)
+    attr_types = {
+        'value': 'float'
+    }
 
 
 class TimeElapsed(Node, Condition):
@@ -561,6 +1155,10 @@ class TimeElapsed(Node, Condition):
     每隔一段时间才会触发一次子节点，其他时间直接返回之前的状态
     """
 
+    attr_types = {
+        'duration': 'float'
+    }
+
     def __init__(self, duration: float | str = 5.0, time: str | float = 'time', immediate: bool | str = False,
                  **kwargs):
         """
@@ -602,13 +1200,16 @@ class TimeElapsed(Node, Condition):
 
     def update(self) -> Status:
         self.curr_time = self.get_time(self.time)
-        self.curr_duration = self.converter.float(self.duration)
+        self.curr_duration = self.param('duration')
 
         if self.last_time is None:
             self.last_time = self.curr_time
+            self.schedule_timer(self.curr_time + self.curr_duration)
             return Status.SUCCESS if self.immediate else Status.FAILURE
 
         if self.curr_time - self.last_time >= self.curr_duration:
             self.last_time = self.curr_time
+            self.schedule_timer(self.curr_time + self.curr_duration)
             return Status.SUCCESS
+        self.schedule_timer(self.last_time + self.curr_duration)
         return Status.FAILURE
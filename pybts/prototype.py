@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import typing
+
+import py_trees
+
+from pybts.nodes import Node
+from pybts.tree import Tree
+
+# 所有实例共用的节点属性：参数、预编译的参数、纯条件节点共用结果的key、执行器，setup之后不会再变化
+# bindings在param读取新的参数时还会增加，实例第一次写入时复制一份（参考Node.bind）
+SHARED_ATTRS = frozenset({ 'attrs', 'bindings', '_pure_key', 'executor' })
+
+_CONTAINERS = frozenset({ list, dict, set })
+
+
+def _copy_container(value: list | dict | set, clones: typing.Dict[Node, Node]):
+    """复制一层容器，其中引用的节点（children、child_stats等）换成实例中对应的节点"""
+    value_type = type(value)
+    if value_type is list:
+        return [clones.get(item, item) if isinstance(item, Node) else item for item in value]
+    elif value_type is set:
+        return { clones.get(item, item) if isinstance(item, Node) else item for item in value }
+    return {
+        clones.get(key, key) if isinstance(key, Node) else key: item.copy() if type(item) is list else item
+        for key, item in value.items()
+    }
+
+
+class TreePrototype:
+    """
+    同一份树定义的大量实例，例如每个agent一棵同样的树：
+
+        prototype = TreePrototype(Builder().build_from_file('agent.xml'), engine='flat', mode='lean')
+        trees = [prototype.instantiate(context=Context(agent_id=i)) for i in range(5000)]
+
+    定义（节点的类型、参数attrs、子节点结构、预编译的参数bindings、FlatEngine编译好的数组）只构建和setup一次，由所有实例共用；
+    实例化时不再经过Builder和节点的setup，每个实例只分配自己的节点对象（运行状态加上对共用定义的引用）、计数表和context
+
+    root: Builder构建好、还没有setup的根节点，用它setup一棵模版树（self.tree），模版树只用来复制，创建之后不要tick或者修改它
+    context: setup模版树时使用的context，节点的名字等参数在setup时渲染，所有实例都使用渲染的结果
+    其他参数和Tree、Tree.setup一致
+    """
+
+    def __init__(self, root: py_trees.behaviour.Behaviour, name: str = '', context: dict = None,
+                 clock: str | typing.Callable[[], float] = 'time', engine: str = 'generator', mode: str = 'debug'):
+        for node in root.iterate():
+            assert isinstance(node, Node), f'TreePrototype: {node.name} is not a pybts node'
+        self.tree = Tree(root=root, name=name, context=context, clock=clock).setup(engine=engine, mode=mode)
+        # 每个节点的复制方案：(节点, 初始状态, 引用节点的属性, 需要复制的容器属性)，实例化时照着执行，不再逐个检查属性
+        self._plan = [self._make_plan(node) for node in self.tree.nodes]
+
+    @property
+    def root(self) -> Node:
+        return self.tree.root
+
+    @staticmethod
+    def _make_plan(node: Node) -> tuple:
+        # 和pickle使用同一份状态（参考Node.__getstate__），不需要复制的延迟属性、生成器等已经去掉了
+        state = node.__getstate__()
+        state.pop('id', None)  # 每个实例有自己的uuid，第一次读取时生成
+        node_keys = []
+        container_keys = []
+        for key, value in state.items():
+            if key in SHARED_ATTRS:
+                state[key] = node.__dict__[key]
+            elif isinstance(value, Node):
+                node_keys.append(key)
+            elif type(value) in _CONTAINERS:
+                container_keys.append(key)
+        state['_bindings_shared'] = True  # param读取新的参数时先复制bindings，不写入共用的定义
+        return node, state, tuple(node_keys), tuple(container_keys)
+
+    def instantiate(self, context: dict = None) -> Tree:
+        """创建一棵setup好的新树，context默认是新的dict"""
+        template = self.tree
+        clones = { node: object.__new__(type(node)) for node in template.nodes }
+        for node, state, node_keys, container_keys in self._plan:
+            state = state.copy()
+            for key in node_keys:
+                state[key] = clones[state[key]]
+            for key in container_keys:
+                state[key] = _copy_container(state[key], clones)
+            clones[node].__setstate__(state)
+
+        root = clones[template.root]
+        tree = Tree(root=root, name=template.name, context=context, clock=template.clock.source)
+        tree._has_setup = True
+        tree.mode = template.mode
+        tree.shed_ratio = template.shed_ratio
+        tree._attach_nodes()
+        tree._setup_runtime()
+        if template.engine is not None:
+            tree.engine = template.engine.instantiate(root, clones)
+        return tree
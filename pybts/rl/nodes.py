@@ -26,6 +26,8 @@ class Reward(Node):
     奖励会累积，所以PPO节点在消费奖励时要记录一下上次拿到的奖励值，然后将两次差值作为最终奖励
     """
 
+    lazy_reset = False  # 每轮开始时立即reset，不依赖之后会不会被tick
+
     def __init__(self, reward: str | float, domain: str = 'default', **kwargs):
         super().__init__(**kwargs)
         self.reward = reward
@@ -65,6 +67,8 @@ class ConditionReward(Decorator):
     only_on_status_change: 只有在子节点的状态改变时才会提供奖励
     """
 
+    lazy_reset = False  # 累积奖励在每轮开始时立即清零
+
     def __init__(self,
                  scope: str = 'default',
                  success: float | str = 1, failure: float | str = 0, running: float | str = 0.5,
@@ -129,7 +133,14 @@ class ConditionReward(Decorator):
 
 
 class RLBaseNode(ABC):
-    """强化学习基础节点，拿来跟其他的Node多继承用"""
+    """
+    强化学习基础节点，拿来跟其他的Node多继承用
+    reset时需要通知rl_handler结束这一轮，所以子类总是在Tree.reset时立即reset（不使用延迟reset，参考Node.lazy_reset）
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lazy_reset = False  # 不管继承顺序，都覆盖Node上的默认值
 
     def __init__(self):
         self.rl_accum_reward = 0  # 当前累积奖励
@@ -31,8 +31,9 @@ class RLTree(Tree):
             post_tick_handler: typing.Optional[
                 typing.Callable[[RLTree], None]
             ] = None,
-    ) -> None:
+            budget_ms: typing.Optional[float] = None,
+    ) -> bool:
         # 不清空奖励，由PPO节点自行判断
         # for scope in self.context['reward']:
         #     self.context['reward'][scope] = 0  # 在tick之前清空奖励
-        super().tick(pre_tick_handler=pre_tick_handler, post_tick_handler=post_tick_handler)
+        return super().tick(pre_tick_handler=pre_tick_handler, post_tick_handler=post_tick_handler, budget_ms=budget_ms)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import types
+import typing
+
+import numpy as np
+import py_trees
+
+from pybts.context import Context
+
+# 节点上不属于运行状态的属性：树的结构、预编译的参数、日志等，快照时不复制，所有快照共用
+STATIC_ATTRS = frozenset({
+    'name', 'serial', 'attrs', 'context', 'bindings', 'debug', '_converter', '_tick_state', '_pure_key', '_bindings_shared',
+    'children', 'parent', 'decorated', 'priority', 'shed_status', 'executor',
+    'id', 'logger', 'iterator', 'blackboards', 'qualified_name', 'counters', 'actions', 'child_stats',
+})
+
+# 只复制一层的可变容器，其他值（数字、字符串、Status、元组等）直接共用引用
+_CONTAINERS = frozenset({ list, dict, set })
+
+
+class NodeState:
+    """
+    节点的运行状态：实例属性中除了STATIC_ATTRS之外的部分
+    生成器（例如_updater_iter）无法复制，不保存，恢复时删除（回到类上的默认值）
+    commutative的组合节点会在tick中重新排列children并更新child_stats，这两项也需要保存
+    """
+    __slots__ = ('values', 'containers', 'dropped', 'keys', 'order', 'child_stats')
+
+    def __init__(self, node: py_trees.behaviour.Behaviour):
+        values = { }
+        containers = []
+        dropped = []
+        for key, value in node.__dict__.items():
+            if key in STATIC_ATTRS:
+                continue
+            value_type = type(value)
+            if value_type in _CONTAINERS:
+                containers.append(key)
+                value = value.copy()
+            elif value_type is types.GeneratorType:
+                dropped.append(key)
+                continue
+            values[key] = value
+        self.values = values
+        self.containers = tuple(containers)
+        self.dropped = tuple(dropped)
+        self.keys = frozenset(node.__dict__)  # 快照时的属性名，恢复时没有变化就不需要逐个检查新增的属性
+        self.order = None
+        self.child_stats = None
+        if 'child_stats' in node.__dict__ and node.commutative:
+            self.order = tuple(node.children)
+            self.child_stats = { child: stats.copy() for child, stats in node.child_stats.items() }
+
+    def restore(self, node: py_trees.behaviour.Behaviour) -> None:
+        attrs = node.__dict__
+        if attrs.keys() == self.keys:
+            for key in self.dropped:
+                attrs.pop(key, None)
+        else:
+            values = self.values
+            for key in [key for key in attrs if key not in STATIC_ATTRS and key not in values]:
+                del attrs[key]
+        attrs.update(self.values)
+        for key in self.containers:
+            attrs[key] = attrs[key].copy()  # 同一个快照可以恢复多次
+        if self.order is not None:
+            node.children[:] = self.order  # 保持同一个列表对象
+            node.child_stats = { child: stats.copy() for child, stats in self.child_stats.items() }
+
+
+class TreeSnapshot:
+    """
+    树的运行状态快照（参考Tree.snapshot）
+
+    只保存会在tick中变化的部分：每个节点的状态（status、current_index、last_value、last_time等实例属性）、计数表、
+    tick次数、epoch、时钟、定时器以及context的浅拷贝。树的结构和预编译的参数不复制，快照只能恢复到创建它的树上。
+    同一个快照可以恢复多次。
+
+    限制：
+    - 生成器没办法复制，updater执行到一半的节点恢复之后会从头开始执行updater
+    - context和节点属性只复制一层，原地修改的嵌套对象（例如context['agent']['x'] = 1）不会被恢复
+    - AsyncAction/FutureAction的任务是共用的，恢复之后引用的还是同一个任务
+    """
+
+    __slots__ = ('tree_id', 'count', 'epoch', 'now', 'states', 'counters', 'context', 'context_version',
+                 'timers', '_tick_version')
+
+    def __init__(self, tree):
+        self.tree_id = id(tree)
+        self.count = tree.count
+        self.epoch = tree.tick_state.epoch
+        self.now = tree.clock.now
+        self.states = [NodeState(node) for node in tree.nodes]
+        self.counters: typing.Optional[np.ndarray] = None if tree.counters is None else tree.counters.data.copy()
+        self.context = dict(tree.context)
+        self.context_version = tree.context.version if isinstance(tree.context, Context) else None
+        self.timers = tree.timers.get_state()
+        self._tick_version = tree._tick_version
+
+    @property
+    def statuses(self) -> typing.List[py_trees.common.Status]:
+        """快照时每个节点的状态（按Tree.nodes的顺序）"""
+        return [state.values.get('status', py_trees.common.Status.INVALID) for state in self.states]
+
+    def restore(self, tree) -> None:
+        assert self.tree_id == id(tree), f'Tree {tree.name}: snapshot belongs to another tree'
+        assert not tree.preempted, f'Tree {tree.name}: cannot restore while a tick is preempted'
+        tree.count = self.count
+        tree.tick_state.epoch = self.epoch
+        tree.clock.now = self.now
+        for node, state in zip(tree.nodes, self.states):
+            state.restore(node)
+        if self.counters is not None:
+            tree.counters.data[...] = self.counters
+        self._restore_context(tree.context)
+        tree.timers.set_state(self.timers)
+        tree._tick_version = self._tick_version
+        if tree.engine is not None:
+            tree.engine.frontier = None  # 运行前沿会在下一次tick时重新计算
+
+    def _restore_context(self, context: dict) -> None:
+        saved = self.context
+        if isinstance(context, Context) and self.context_version is not None:
+            # 只写回快照之后被写过的key，其他key的版本号不变，纯条件节点的缓存仍然有效
+            for key in context.written_since(self.context_version):
+                if key in saved:
+                    if not dict.__contains__(context, key) or dict.__getitem__(context, key) is not saved[key]:
+                        context[key] = saved[key]
+                elif dict.__contains__(context, key):
+                    del context[key]
+        else:
+            context.clear()
+            context.update(saved)
@@ -1,15 +1,30 @@
+import asyncio
+import contextlib
+import math
+import time
 import typing
 
 import py_trees
 from py_trees import common, visitors
 from py_trees.trees import BehaviourTree
 
-from pybts.nodes import Node
+from pybts.nodes import Node, TickState
 from pybts.builder import Builder
+from pybts.context import Context
+from pybts.counters import CounterTable
+from pybts.clock import Clock, TimerWheel, RunStats
+from pybts.converter import Converter
+from pybts.snapshot import TreeSnapshot
 
 
 class Tree(py_trees.trees.BehaviourTree):
-    def __init__(self, root: py_trees.behaviour.Behaviour, name: str = '', context: dict = None):
+    def __init__(self, root: py_trees.behaviour.Behaviour, name: str = '', context: dict = None,
+                 clock: str | typing.Callable[[], float] = 'time'):
+        """
+        context: 共享的字典，默认是普通的dict。传入pybts.context.Context时会追踪读写，纯条件节点在依赖没有变化时跳过update，
+            这时原地修改嵌套的对象（例如 context['agent']['hp'] = 1）需要重新赋值或者调用context.touch
+        clock: 树的时钟来源，每帧读取一次（参考pybts.clock.Clock），time参数和它相同的节点直接使用这个时间
+        """
         super().__init__(root=root)
         self.name = name or root.name
         self.reset_handlers: typing.List[
@@ -22,6 +37,109 @@ class Tree(py_trees.trees.BehaviourTree):
             self.context = context
         self.context['round'] = 0
         self._has_setup = False
+        self.engine = None  # FlatEngine，在setup时选择engine='flat'才会创建
+        self.mode = 'debug'
+        self.counters: typing.Optional[CounterTable] = None  # 所有节点的计数表，在setup时创建
+        self.tick_state = TickState()  # 和所有节点共用的状态：epoch、降载的阈值等
+        self.shed_ratio = 0.8  # 有时间预算的tick用掉这个比例的预算之后，开始跳过优先级为负数的节点
+        self._eager_reset_nodes: typing.List[Node] = []  # 不支持延迟reset的节点（参考pybts.engine.supports_lazy_reset）
+        self._pending: typing.Optional[typing.Iterator[py_trees.behaviour.Behaviour]] = None  # 超出时间预算被暂停的tick
+        self.last_ticked: typing.Optional[py_trees.behaviour.Behaviour] = None  # 被暂停的tick最后执行完的节点
+        self.preempt_count = 0  # tick被暂停的次数
+        self.clock = Clock(clock)
+        self.timers = TimerWheel()
+        self.tick_state.clock = self.clock
+        self.tick_state.timers = self.timers
+        self._tick_version: typing.Optional[int] = None  # 上一帧结束时context的版本号，用于判断是否空闲
+        self.nodes: typing.List[py_trees.behaviour.Behaviour] = []  # 所有节点（root.iterate()的顺序），在setup时生成
+
+    @property
+    def epoch(self) -> int:
+        """reset的次数，节点的epoch落后于它时会在下一次被tick时reset"""
+        return self.tick_state.epoch
+
+    @property
+    def shed_below(self) -> float:
+        """优先级低于它的节点每帧都会被跳过（例如服务器负载高的时候调高），默认-inf表示不跳过"""
+        return self.tick_state.shed_below
+
+    @shed_below.setter
+    def shed_below(self, value: float) -> None:
+        self.tick_state.shed_below = value
+
+    def snapshot(self) -> TreeSnapshot:
+        """保存运行状态（参考TreeSnapshot），树的结构不复制，用于前瞻搜索等需要反复回到同一个状态的场景"""
+        assert self._has_setup, f'Tree {self.name} has not been setup'
+        assert not self.preempted, f'Tree {self.name}: cannot snapshot while a tick is preempted'
+        return TreeSnapshot(self)
+
+    def restore(self, snapshot: TreeSnapshot) -> None:
+        """恢复到snapshot时的运行状态"""
+        snapshot.restore(self)
+
+    @contextlib.contextmanager
+    def fork(self) -> typing.Iterator['Tree']:
+        """
+        在with里随意tick（例如蒙特卡洛前瞻），退出时恢复到进入时的状态：
+            with tree.fork():
+                for _ in range(depth):
+                    tree.tick()
+                score = evaluate(tree.context)
+        """
+        snapshot = self.snapshot()
+        try:
+            yield self
+        finally:
+            snapshot.restore(self)
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        """
+        setup好的树可以直接pickle（例如发送到multiprocessing的子进程），反序列化后可以直接tick，不需要重新构建和setup
+        节点不保存的属性参考Node.__getstate__；FlatEngine在反序列化时重新编译
+        context需要可以pickle，Context的版本号和纯条件节点的缓存不保存，pre/post_tick_handler等回调也需要可以pickle
+        """
+        assert not self.preempted, f'Tree {self.name}: cannot pickle while a tick is preempted'
+        state = self.__dict__.copy()
+        state['engine'] = self.engine is not None  # FlatEngine按id索引节点，只记录是否需要编译
+        state['_tick_version'] = None  # 反序列化后Context的版本号从0开始
+        return state
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        self.__dict__.update(state)
+        if self.counters is not None and self.mode == 'debug':
+            self.counters.attach()
+        if self.engine:
+            self.compile()
+        else:
+            self.engine = None
+
+    def idle_until(self) -> float:
+        """
+        在什么时间（时钟的单位）之前不需要tick：
+        没有节点在RUNNING、上一帧之后context没有被写过（时钟依赖的key除外）时，tick的结果只会因为时间变化，也就是要等到下一个定时器到期，
+        没有定时器时返回inf（直到context变化之前都不需要tick）；否则返回clock.now，表示现在就需要tick
+        只有Context能判断有没有被写过，普通dict的树永远不会空闲；还没有tick过（时钟没有读取过）时返回-inf
+        """
+        now = self.clock.now
+        if now is None:
+            return -math.inf
+        if self._pending is not None or self.root.status == common.Status.RUNNING:
+            return now
+        context = self.context
+        if not isinstance(context, Context) or self._tick_version is None:
+            return now
+        if context.version != self._tick_version and not context.written_since(self._tick_version) <= self.clock.keys:
+            return now
+        return self.timers.next_deadline()
+
+    def _start_tick(self) -> None:
+        """pre_tick_handler之后：读取这一帧的时间，丢弃到期的定时器"""
+        self.timers.pop_due(self.clock.read())
+
+    def _finish_tick(self) -> None:
+        if isinstance(self.context, Context):
+            self._tick_version = self.context.version
+        self.count += 1
 
     @property
     def round(self):
@@ -36,27 +154,107 @@ class Tree(py_trees.trees.BehaviourTree):
             self,
             timeout: typing.Union[float, common.Duration] = common.Duration.INFINITE,
             visitor: typing.Optional[visitors.VisitorBase] = None,
+            engine: str = 'generator',
+            mode: str = 'debug',
             **kwargs: any,
     ) -> 'Tree':
+        """
+        engine: tick的执行方式
+        - generator: 默认，通过嵌套的生成器逐层tick
+        - flat: 将树编译成扁平数组，用循环代替生成器执行（参考FlatEngine）
+        mode: 运行模式
+        - debug: 默认，每个节点记录计数（保存在self.counters中）并输出debug日志
+        - lean: 生产环境使用，关闭计数和日志格式化，计数保持为0
+        """
         assert not self._has_setup, f'Tree {self.name} already has setup'
+        assert engine in ['generator', 'flat'], f'Tree {self.name}: unknown engine {engine}'
+        assert mode in ['debug', 'lean'], f'Tree {self.name}: unknown mode {mode}'
         self._has_setup = True
+        self.mode = mode
+        self._attach_nodes()
+        super().setup(timeout=timeout, visitor=visitor, **kwargs)
+        self._setup_runtime()
+        if engine == 'flat':
+            self.compile()
+        return self
+
+    def _attach_nodes(self) -> None:
+        """把树的context、模式和共用状态交给每个节点"""
+        from pybts.engine import supports_lazy_reset
         for node in self.root.iterate():
             node.context = self.context
-        super().setup(timeout=timeout, visitor=visitor, **kwargs)
+            node.debug = self.mode == 'debug'
+            if isinstance(node, Node):
+                node._tick_state = self.tick_state
+                node.epoch = self.epoch
+                if not supports_lazy_reset(node):
+                    self._eager_reset_nodes.append(node)
+
+    def _setup_runtime(self) -> None:
+        """节点setup之后：创建计数表、设置时钟（时钟在第一次tick时才读取，setup时context里可能还没有时间）"""
+        self.nodes = list(self.root.iterate())
+        self.counters = CounterTable(self.nodes)
+        if self.mode == 'debug':
+            # lean模式不计数，节点不需要持有计数表的视图
+            self.counters.attach()
+        self.clock.converter = Converter(self.root, context=self.context)
+
+    def compile(self) -> 'Tree':
+        """编译成FlatEngine，修改了树的结构之后需要重新调用"""
+        from pybts.engine import FlatEngine
+        self.engine = FlatEngine(self.root)
         return self
 
-    def reset(self):
+    def reset(self, lazy: bool = True):
+        """
+        开始新的一轮
+        lazy: 默认延迟reset，只把epoch加1并立即reset根节点（根节点停止时会停止所有没有结束的子孙节点，所以状态马上就是INVALID），
+            其他节点在新一轮第一次被tick时才执行自己的reset，开销只和执行到的节点数有关，没有被执行到的节点不会被reset
+            lazy=False时遍历所有节点reset，setup之后才加入树的节点也会被纳入epoch管理
+        """
         self.count = 0
         self.round += 1
-        for node in self.root.iterate():
-            if isinstance(node, Node):
-                node.reset()
+        if self._pending is not None:
+            # 放弃被暂停的tick，关闭生成器时正在执行的组合节点不会再继续
+            self._pending.close()
+            self._pending = None
+            self.last_ticked = None
+            # 第一帧就被暂停时根节点还是INVALID，停止根节点不会停止已经RUNNING的子孙节点（例如还在执行的异步任务），需要逐个停止
+            for node in self.root.iterate():
+                if node.status == common.Status.RUNNING:
+                    node.stop(common.Status.INVALID)
+        if self.counters is not None:
+            self.counters.reset()
+        if isinstance(self.context, Context):
+            self.context.pure_results.clear()
+        self.timers.clear()
+        self.tick_state.epoch += 1
+        if lazy and self._has_setup:
+            if isinstance(self.root, Node):
+                self.root.sync_epoch()
+            for node in self._eager_reset_nodes:
+                node.sync_epoch()
+        else:
+            for node in self.root.iterate():
+                if not isinstance(node, Node):
+                    continue
+                if node._tick_state is self.tick_state:
+                    node.sync_epoch()  # 会补上之前延迟没有执行的reset次数
+                else:
+                    node._tick_state = self.tick_state
+                    node.epoch = self.epoch
+                    node.reset()
         for handler in self.reset_handlers:
             handler(self)
 
     def add_reset_handler(self, handler: typing.Callable[["Tree"], None]):
         self.reset_handlers.append(handler)
 
+    @property
+    def preempted(self) -> bool:
+        """上一次tick是否因为超出时间预算被暂停，下一次tick会从暂停的地方继续"""
+        return self._pending is not None
+
     def tick(
             self: 'Tree',
             pre_tick_handler: typing.Optional[
@@ -65,6 +263,187 @@ class Tree(py_trees.trees.BehaviourTree):
             post_tick_handler: typing.Optional[
                 typing.Callable[['Tree'], None]
             ] = None,
-    ) -> None:
+            budget_ms: typing.Optional[float] = None,
+    ) -> bool:
+        """
+        budget_ms: 本次调用的时间预算（毫秒），None表示不限制
+            超出预算时在下一个节点执行完的位置暂停（组合节点执行完一个子节点之后），返回False，
+            此时preempted为True，last_ticked是最后执行完的节点，count不增加，根节点的状态还是上一帧的，
+            下一次调用tick会从暂停的地方继续（不会再执行pre_tick_handler），直到这一帧完成
+            单个节点的update本身不会被打断，耗时很长的动作请写成updater，每次只做一部分并返回RUNNING
+            用掉shed_ratio比例的预算之后，优先级为负数的节点会被跳过（参考Node.priority）
+            有时间预算时总是用生成器逐层执行（FlatEngine没有可以暂停的位置）
+        返回这一帧是否已经完成
+        """
+        assert self._has_setup, f'Tree {self.name} has not been setup'
+        if budget_ms is not None or self._pending is not None:
+            return self._tick_with_budget(pre_tick_handler, post_tick_handler, budget_ms)
+
+        if self.visitors:
+            # visitor需要遍历每个tick到的节点，和py_trees的实现一致
+            return self._tick_with_budget(pre_tick_handler, post_tick_handler, None)
+
+        # 没有visitor时不需要像py_trees那样在每帧结束后再遍历整棵树
+        if pre_tick_handler is not None:
+            pre_tick_handler(self)
+        for handler in self.pre_tick_handlers:
+            handler(self)
+        self._start_tick()
+        if self.engine is None:
+            for _ in self.root.tick():
+                pass
+        else:
+            self.engine.tick()
+        for handler in self.post_tick_handlers:
+            handler(self)
+        if post_tick_handler is not None:
+            post_tick_handler(self)
+        self._finish_tick()
+        return True
+
+    def run(
+            self,
+            hz: typing.Optional[float] = 10,
+            max_ticks: typing.Optional[int] = None,
+            until: typing.Optional[typing.Callable[['Tree'], bool]] = None,
+            skip_idle: bool = False,
+            max_periods: typing.Optional[int] = None,
+            budget_ms: typing.Optional[float] = None,
+            post_tick_handler: typing.Optional[typing.Callable[['Tree'], None]] = None,
+    ) -> RunStats:
+        """
+        按固定频率运行，代替手写的 while True: tree.tick(); time.sleep(...)
+
+        hz: 频率，None或者0表示不等待，尽快执行
+            每一帧的开始时间按 起始时间 + k * 周期 计算，只睡剩下的时间，sleep的误差不会累积；
+            某一帧超时了会计入overruns，落后超过一个周期时不再追赶，从当前时间重新计算
+        max_ticks: 最多执行的帧数（空闲跳过的周期不算）
+        until: 每个周期检查一次，返回True时停止
+        skip_idle: 默认关闭，开启后树空闲时（参考idle_until）跳过这个周期，不执行tick；
+            树可能一直空闲（例如根节点已经结束、context不再变化），这时只靠max_ticks不会停止，需要配合until或者max_periods
+        max_periods: 最多经过的周期数（执行的帧和空闲跳过的周期都算）
+        budget_ms: 传给tick的时间预算，暂停的帧在下一个周期继续
+        post_tick_handler: 每帧完成后调用，例如 lambda tree: board.track()
+        返回RunStats
+        """
+        stats = RunStats()
+        for slack in self._run_steps(stats, hz, max_ticks, until, skip_idle, max_periods, budget_ms,
+                                     post_tick_handler):
+            if slack > 0:
+                time.sleep(slack)
+        return stats
+
+    async def tick_async(
+            self,
+            pre_tick_handler: typing.Optional[typing.Callable[['Tree'], None]] = None,
+            post_tick_handler: typing.Optional[typing.Callable[['Tree'], None]] = None,
+            budget_ms: typing.Optional[float] = None,
+    ) -> bool:
+        """
+        在事件循环里tick：节点本身还是同步执行的（AsyncAction只是提交或者检查自己的任务），
+        tick结束后让出一次控制权，让AsyncAction的任务和同一个事件循环里的其他树继续执行
+        """
+        done = self.tick(pre_tick_handler=pre_tick_handler, post_tick_handler=post_tick_handler, budget_ms=budget_ms)
+        await asyncio.sleep(0)
+        return done
+
+    async def run_async(
+            self,
+            hz: typing.Optional[float] = 10,
+            max_ticks: typing.Optional[int] = None,
+            until: typing.Optional[typing.Callable[['Tree'], bool]] = None,
+            skip_idle: bool = False,
+            max_periods: typing.Optional[int] = None,
+            budget_ms: typing.Optional[float] = None,
+            post_tick_handler: typing.Optional[typing.Callable[['Tree'], None]] = None,
+    ) -> RunStats:
+        """
+        run的异步版本，等待时不阻塞事件循环，多棵树可以在同一个线程里一起运行：
+            await asyncio.gather(*(tree.run_async(hz=10) for tree in trees))
+        每个周期至少让出一次控制权
+        """
+        stats = RunStats()
+        for slack in self._run_steps(stats, hz, max_ticks, until, skip_idle, max_periods, budget_ms,
+                                     post_tick_handler):
+            await asyncio.sleep(max(slack, 0))
+        return stats
+
+    def _run_steps(self, stats: RunStats, hz, max_ticks, until, skip_idle, max_periods, budget_ms, post_tick_handler) \
+            -> typing.Iterator[float]:
+        """run和run_async共用的调度逻辑，每个周期结束时产出需要等待的时间（秒），小于等于0表示不需要等待"""
         assert self._has_setup, f'Tree {self.name} has not been setup'
-        super().tick(pre_tick_handler=pre_tick_handler, post_tick_handler=post_tick_handler)
+        period = 1 / hz if hz else 0
+        perf_counter = time.perf_counter
+        start = next_time = perf_counter()
+        while (max_ticks is None or stats.ticks < max_ticks) and (max_periods is None or stats.periods < max_periods):
+            if until is not None and until(self):
+                break
+            stats.periods += 1
+            if skip_idle and self._pending is None and self.idle_until() > self.clock.read():
+                stats.idle_skips += 1
+            else:
+                tick_start = perf_counter()
+                if self.tick(post_tick_handler=post_tick_handler, budget_ms=budget_ms):
+                    stats.ticks += 1
+                stats.latencies.append(perf_counter() - tick_start)
+
+            slack = 0
+            if period > 0:
+                next_time += period
+                slack = next_time - perf_counter()
+                if slack <= 0:
+                    stats.overruns += 1
+                    if slack < -period:
+                        next_time = perf_counter()
+            yield slack
+        stats.elapsed = perf_counter() - start
+
+    def _tick_with_budget(self, pre_tick_handler, post_tick_handler, budget_ms: typing.Optional[float]) -> bool:
+        if self._pending is None:
+            self._pending = self._tick_steps(pre_tick_handler, post_tick_handler)
+        deadline = None
+        if budget_ms is not None:
+            start = time.perf_counter()
+            deadline = start + budget_ms / 1000
+            self.tick_state.deadline = start + budget_ms * self.shed_ratio / 1000
+        try:
+            for node in self._pending:
+                self.last_ticked = node
+                # 根节点产出之后只剩下收尾的handler，不需要再暂停
+                if deadline is not None and node is not self.root and time.perf_counter() >= deadline:
+                    self.preempt_count += 1
+                    return False
+        finally:
+            self.tick_state.deadline = math.inf
+        self._pending = None
+        self.last_ticked = None
+        return True
+
+    def _tick_steps(self, pre_tick_handler, post_tick_handler) -> typing.Iterator[py_trees.behaviour.Behaviour]:
+        """可以暂停的一帧：和py_trees的BehaviourTree.tick一致，每执行完一个节点产出一次"""
+        if pre_tick_handler is not None:
+            pre_tick_handler(self)
+        for handler in self.pre_tick_handlers:
+            handler(self)
+        self._start_tick()
+        for visitor in self.visitors:
+            visitor.initialise()
+
+        for node in self.root.tick():
+            for visitor in self.visitors:
+                if not visitor.full:
+                    node.visit(visitor)
+            yield node
+
+        if self.visitors:
+            for node in self.root.iterate():
+                for visitor in self.visitors:
+                    if visitor.full:
+                        node.visit(visitor)
+        for visitor in self.visitors:
+            visitor.finalise()
+        for handler in self.post_tick_handlers:
+            handler(self)
+        if post_tick_handler is not None:
+            post_tick_handler(self)
+        self._finish_tick()
@@ -9,7 +9,6 @@ import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import os
 import json
-import jinja2
 
 
 def read_queue_without_destroying(q: Queue):
@@ -283,7 +282,8 @@ def clear_project(log_dir: str, project: str):
 
 
 def jinja2_render(template: str, context: dict) -> str:
-    return jinja2.Template(template).render(context)
+    from pybts.converter import compile_template
+    return compile_template(template).render(context)
 
 
 def camel_case_to_snake_case(name):
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from pybts import *
+from pybts.batch import BatchTree
+
+
+class ToggleByContext(Node, Condition):
+    """根据context中的计数器循环返回状态，单实例和批量两种实现"""
+
+    def __init__(self, key: str, status_list: list[Status], **kwargs):
+        super().__init__(**kwargs)
+        self.key = key
+        self.status_list = status_list
+
+    def update(self) -> Status:
+        self.context[self.key] = self.context.get(self.key, self.context['offset']) + 1
+        return self.status_list[self.context[self.key] % len(self.status_list)]
+
+    def batch_update(self, batch, mask):
+        new_status = np.zeros(len(mask), dtype=np.int8)
+        for n in np.flatnonzero(mask):
+            context = batch.contexts[n]
+            context[self.key] = context.get(self.key, context['offset']) + 1
+            new_status[n] = STATUS_TO_BATCH_STATUS[self.status_list[context[self.key] % len(self.status_list)]]
+        return new_status
+
+
+S, F, R = Status.SUCCESS, Status.FAILURE, Status.RUNNING
+
+
+def build_root():
+    return Parallel(children=[
+        Sequence(children=[
+            IsMatchRule(rule='{{offset}} % 2 == 0'),
+            ToggleByContext(key='a', status_list=[R, S, F, R]),
+            Selector(children=[
+                ToggleByContext(key='b', status_list=[F, R, S]),
+                Inverter(children=[ToggleByContext(key='c', status_list=[S, F, R])]),
+            ]),
+        ]),
+        SelectorWithMemory(children=[
+            ToggleByContext(key='d', status_list=[F, F, S]),
+            ToggleByContext(key='e', status_list=[R, R, F, S]),
+        ]),
+        ReactiveSequence(children=[
+            ToggleByContext(key='f', status_list=[S, F]),
+            RunningIsFailure(children=[ToggleByContext(key='g', status_list=[R, R, S])]),
+        ]),
+        CondBranch(children=[
+            ToggleByContext(key='h', status_list=[S, F, R, S, F]),
+            ToggleByContext(key='i', status_list=[R, S]),
+            ToggleByContext(key='j', status_list=[F, R]),
+        ]),
+    ], success_threshold=-1)
+
+
+class TestBatchTree(unittest.TestCase):
+
+    def test_same_status_as_single_trees(self):
+        n = 7
+        trees = [Tree(root=build_root(), context={ 'offset': k }).setup() for k in range(n)]
+        batch = BatchTree(root=build_root(), contexts=[{ 'offset': k } for k in range(n)]).setup()
+
+        for t in range(20):
+            for tree in trees:
+                tree.tick()
+            batch.tick()
+            single_nodes = [_bfs(tree.root) for tree in trees]
+            for i in range(len(batch.nodes)):
+                expected = [nodes[i].status for nodes in single_nodes]
+                self.assertEqual(expected, batch.statuses(i), f'tick {t} node {i}')
+
+        self.assertEqual(batch.count, 20)
+
+    def test_reset(self):
+        batch = BatchTree(root=Sequence(children=[Running()]), contexts=3).setup()
+        batch.tick()
+        self.assertEqual(batch.statuses(), [R, R, R])
+        batch.reset(mask=np.array([True, False, True]))
+        self.assertEqual(batch.statuses(), [Status.INVALID, R, Status.INVALID])
+        self.assertEqual([context['round'] for context in batch.contexts], [1, 0, 1])
+
+    def test_unsupported_node(self):
+        with self.assertRaises(Exception):
+            BatchTree(root=Sequence(children=[Print(msg='hello')]), contexts=2).setup()
+
+
+def _bfs(root):
+    nodes = [root]
+    for node in nodes:
+        nodes.extend(node.children)
+    return nodes
@@ -0,0 +1,109 @@
+import math
+import unittest
+from pybts import *
+from pybts.clock import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_schedule(self):
+        a, b, c = Success(), Success(), Success()
+        timers = TimerWheel()
+        self.assertEqual(timers.next_deadline(), math.inf)
+        timers.schedule(a, 5)
+        timers.schedule(b, 3)
+        timers.schedule(c, 4)
+        timers.schedule(b, 6)  # 覆盖之前的时间
+        timers.cancel(c)
+        self.assertEqual(timers.next_deadline(), 5)
+        self.assertEqual(timers.deadline_of(b), 6)
+        self.assertEqual(timers.pop_due(5.5), [a])
+        self.assertEqual(len(timers), 1)
+        self.assertEqual(timers.pop_due(10), [b])
+        self.assertEqual(timers.next_deadline(), math.inf)
+
+
+class TestTreeClock(unittest.TestCase):
+
+    def test_simulated_clock(self):
+        elapsed = TimeElapsed(duration=2, time='{{time}}')
+        context = Context(time=0)
+        tree = Tree(root=elapsed, context=context, clock='{{time}}').setup()
+        tree.tick()
+        self.assertEqual(elapsed.curr_time, 0)
+        # 没有节点在运行、context没有变化时，一直空闲到TimeElapsed的下一次触发时间
+        self.assertEqual(tree.idle_until(), 2)
+
+        context['time'] = 1
+        self.assertEqual(tree.idle_until(), 2)  # 时钟自己的key不算context的变化
+        context['target'] = 1
+        self.assertEqual(tree.idle_until(), 0)  # context变了，需要tick
+        tree.tick()
+        self.assertEqual(elapsed.status, Status.FAILURE)
+        self.assertEqual(tree.idle_until(), 2)
+
+        context['time'] = 2.5
+        tree.tick()
+        self.assertEqual(elapsed.status, Status.SUCCESS)
+        self.assertEqual(tree.clock.now, 2.5)
+        self.assertEqual(tree.idle_until(), 4.5)
+
+    def test_setup_before_time(self):
+        # setup时context里还没有时间，第一次tick时才读取时钟
+        tree = Tree(root=Success(), context=Context(), clock='{{time}}').setup()
+        self.assertIsNone(tree.clock.now)
+        self.assertEqual(tree.idle_until(), -math.inf)
+        tree.context['time'] = 3
+        tree.tick()
+        self.assertEqual(tree.clock.now, 3)
+
+    def test_running_is_not_idle(self):
+        root = Timeout(duration=3, time='{{time}}', children=[Running()])
+        context = Context(time=0)
+        tree = Tree(root=root, context=context, clock='{{time}}').setup()
+        tree.tick()
+        self.assertEqual(tree.timers.deadline_of(root), 3)
+        self.assertEqual(tree.idle_until(), 0)
+        context['time'] = 4
+        tree.tick()
+        self.assertEqual(root.status, Status.FAILURE)
+        self.assertNotIn(root, tree.timers)
+
+
+class TestRun(unittest.TestCase):
+
+    def test_fixed_rate(self):
+        tree = Tree(root=Running()).setup()
+        stats = tree.run(hz=200, max_ticks=20)
+        self.assertEqual(stats.ticks, 20)
+        self.assertEqual(tree.count, 20)
+        self.assertEqual(len(stats.latencies), 20)
+        self.assertGreater(stats.elapsed, 19 / 200)
+        self.assertLess(stats.rate, 220)
+        self.assertGreaterEqual(stats.p99, stats.p50)
+
+    def test_skip_idle(self):
+        elapsed = TimeElapsed(duration=3, time='{{time}}')
+        context = Context(time=0)
+        tree = Tree(root=elapsed, context=context, clock='{{time}}').setup()
+
+        def step(tree):
+            # 仿真时间每个周期前进1，只写时钟的key不会打断空闲
+            context['time'] += 1
+            return context['time'] > 10
+
+        stats = tree.run(hz=None, until=step, skip_idle=True)
+        self.assertEqual(stats.periods, 10)
+        # 第一帧在时间1，之后每3秒触发一次：1, 4, 7, 10
+        self.assertEqual(stats.ticks, 4)
+        self.assertEqual(stats.idle_skips, 6)
+        self.assertEqual(elapsed.last_time, 10)
+
+    def test_finished_tree(self):
+        # 默认不跳过空闲的周期，根节点结束之后仍然每个周期执行一帧
+        tree = Tree(root=Success(), context=Context()).setup()
+        stats = tree.run(hz=None, max_ticks=3)
+        self.assertEqual((stats.ticks, stats.idle_skips), (3, 0))
+        # 跳过空闲时树一直空闲，用max_periods限制周期数
+        stats = tree.run(hz=None, max_ticks=3, skip_idle=True, max_periods=5)
+        self.assertEqual((stats.ticks, stats.idle_skips, stats.periods), (0, 5, 5))
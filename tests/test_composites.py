@@ -1,4 +1,6 @@
 import logging
+import math
+import time
 import unittest
 from pybts import *
 
@@ -88,3 +90,167 @@ class TestCondBranch(unittest.TestCase):
 
         self.assertEqual(root.status, Status.SUCCESS)
         self.assertEqual(root.current_index, 2)
+
+
+class TestChildCursor(unittest.TestCase):
+
+    def test_cursor_in_sync(self):
+        first, running = Failure(name='F0'), Running(name='R')
+        root = SelectorWithMemory(children=[first] + [Failure(name=f'F{i}') for i in range(1, 5)] + [running])
+        tree = Tree(root=root).setup()
+        tree.tick()
+        self.assertEqual(root.current_index, 5)
+        self.assertIs(root.current_child, running)
+
+        root.insert_child(Failure(name='I'), 2)
+        self.assertEqual(root.current_index, 6)
+        root.prepend_child(Failure(name='P'))
+        self.assertEqual(root.current_index, 7)
+        root.insert_child(Failure(name='E'), -1)  # 插到R前面
+        self.assertEqual(root.current_index, 8)
+        root.add_child(Failure(name='A'))
+        self.assertEqual(root.current_index, 8)
+        root.remove_child(first)
+        self.assertEqual(root.current_index, 7)
+        self.assertIs(root.current_child, running)
+
+        replacement = Running(name='R2')
+        root.replace_child(running, replacement)
+        self.assertIsNone(root.current_index)
+        self.assertEqual(root.children.index(replacement), 7)
+        self.assertEqual(root.to_data()['current_index'], None)
+
+        root.current_child = replacement
+        self.assertEqual(root.current_index, 7)
+
+
+class TestActiveChildren(unittest.TestCase):
+
+    def test_idle_children_not_stopped(self):
+        for engine in ['generator', 'flat']:
+            toggle = ToggleStatus(status_list=[Status.FAILURE, Status.FAILURE, Status.SUCCESS])
+            idle = [Success() for _ in range(100)]
+            root = ReactiveSelector(children=[toggle, Running()] + idle)
+            tree = Tree(root=root).setup(engine=engine)
+            tree.tick()
+            tree.tick()
+            self.assertEqual(root.children[1].status, Status.RUNNING)
+            tree.tick()
+            # Running被启动过，toggle成功后需要停止它
+            self.assertEqual(root.status, Status.SUCCESS)
+            self.assertEqual(root.children[1].status, Status.INVALID)
+            self.assertEqual(root.children[1].debug_info['invalid_count'], 1)
+            self.assertEqual(root.active_indices, { 0 })
+            for child in idle:
+                self.assertEqual(child.debug_info['terminate_count'], 0)
+                self.assertEqual(child.debug_info['invalid_count'], 0)
+
+
+    def test_resume_cost_flat(self):
+        # 带记忆的Selector恢复执行时，前面已经结束的子节点不应该让每帧的开销随子节点数量增长
+        def cost(width, engine):
+            root = SelectorWithMemory(children=[Failure() for _ in range(width - 1)] + [Running()])
+            tree = Tree(root=root).setup(engine=engine, mode='lean')
+            tree.tick()
+            self.assertEqual(len(root.active_indices), width)
+            best = math.inf
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(200):
+                    tree.tick()
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        for engine in ['generator', 'flat']:
+            self.assertLess(cost(10000, engine), cost(10, engine) * 5, engine)
+
+
+class TestDispatch(unittest.TestCase):
+
+    def test_dispatch_from_xml(self):
+        builder = Builder()
+        for engine in ['generator', 'flat']:
+            root = builder.build_from_xml(xml_data='''
+            <Dispatch key="{{state}}" reactive="true">
+                <Success case="idle"/>
+                <Running case="patrol"/>
+                <Failure case="default"/>
+            </Dispatch>
+            ''')
+            tree = Tree(root=root, context={ 'state': 'idle' }).setup(engine=engine)
+            self.assertEqual(root.case_index, { 'idle': 0, 'patrol': 1 })
+            expected = { 'idle': (Status.SUCCESS, 0), 'patrol': (Status.RUNNING, 1), 'other': (Status.FAILURE, 2) }
+            for state in ['idle', 'patrol', 'other', 'patrol', 'idle']:
+                tree.context['state'] = state
+                tree.tick()
+                self.assertEqual((root.status, root.current_index), expected[state], f'{engine} {state}')
+                if state == 'idle':
+                    self.assertEqual(root.children[1].status, Status.INVALID)
+
+    def test_no_match(self):
+        root = Dispatch(key='{{state}}', cases='a,b', children=[Success(), Running()])
+        tree = Tree(root=root, context={ 'state': 'b' }).setup()
+        tree.tick()
+        self.assertEqual(root.status, Status.RUNNING)
+        tree.context['state'] = 'c'
+        tree.tick()
+        # 非reactive时RUNNING的子节点会继续执行
+        self.assertEqual(root.status, Status.RUNNING)
+        root.reset()
+        tree.tick()
+        self.assertEqual(root.status, Status.FAILURE)
+        self.assertIsNone(root.current_child)
+
+    def test_missing_cases(self):
+        root = Dispatch(key='{{state}}', children=[Success(name='a'), Running(name='b')])
+        with self.assertRaisesRegex(Exception, 'more than one default child'):
+            Tree(root=root, context={ 'state': 'a' }).setup()
+
+
+class TestCommutative(unittest.TestCase):
+
+    def test_reorder_and(self):
+        builder = Builder()
+        for engine in ['generator', 'flat']:
+            root = builder.build_from_xml(xml_data='''
+            <And commutative="true" reorder_interval="5">
+                <Success name="pass"/>
+                <Success name="pass2"/>
+                <Failure name="fail"/>
+            </And>
+            ''')
+            tree = Tree(root=root).setup(engine=engine)
+            for _ in range(4):
+                tree.tick()
+                self.assertEqual(root.status, Status.FAILURE)
+            self.assertEqual([child.name for child in root.children], ['pass', 'pass2', 'fail'])
+            tree.tick()
+            # 总是失败的子节点短路概率最高，排到最前面，结果不变
+            self.assertEqual(root.status, Status.FAILURE)
+            self.assertEqual([child.name for child in root.children], ['fail', 'pass', 'pass2'], engine)
+            self.assertEqual(root.current_index, 0)
+            self.assertEqual(root.children[1].status, Status.INVALID)
+
+            stats = { item['name']: item for item in root.to_data()['child_stats'] }
+            self.assertEqual(stats['pass']['count'], 4)
+            self.assertEqual(stats['pass']['pass_rate'], 1)
+            self.assertEqual(stats['fail']['count'], 5)
+            self.assertEqual(stats['fail']['pass_rate'], 0)
+
+    def test_expected_cost_or(self):
+        root = Selector(commutative=True, children=[Failure(), Success(), Success()])
+        a, b, c = root.children
+        root.record_child(a, 1.0, passed=True)  # Or里的失败会继续执行后面的子节点
+        root.record_child(b, 2.0, passed=False)
+        root.record_child(c, 1.0, passed=False)
+        self.assertTrue(root.reorder_children())
+        self.assertEqual(root.children, [c, b, a])
+        self.assertFalse(root.reorder_children())
+
+    def test_not_commutative(self):
+        root = Sequence(children=[Success(), Failure()])
+        tree = Tree(root=root).setup()
+        for _ in range(200):
+            tree.tick()
+        self.assertEqual(root.child_stats, { })
+        self.assertNotIn('child_stats', root.to_data())
@@ -0,0 +1,126 @@
+import unittest
+from pybts import *
+
+
+class CountedRule(IsMatchRule):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.update_count = 0
+
+    def update(self) -> Status:
+        self.update_count += 1
+        return super().update()
+
+
+class TestContext(unittest.TestCase):
+
+    def test_track(self):
+        context = Context(a=1, b=2)
+        outer = context.track()
+        _ = context['a']
+        _ = context.get('c')
+        reads = context.untrack(outer)
+        self.assertEqual(reads, { 'a', 'c' })
+        self.assertFalse(context.tracking)
+
+        version = context.version
+        context['b'] = 3
+        self.assertFalse(context.changed_since(version, reads))
+        context.update(c=1)
+        self.assertTrue(context.changed_since(version, reads))
+
+    def test_skip_unchanged_condition(self):
+        guard = CountedRule(rule='{{agent.x}} > 10 and hp > 0')
+        other = CountedRule(rule='{{enemy}} == 1')
+        root = ReactiveSequence(children=[guard, other, Running()])
+        context = Context(agent={ 'x': 12 }, hp=5, enemy=1, static=0)
+        tree = Tree(root=root, context=context).setup()
+
+        for _ in range(5):
+            tree.tick()
+            context['static'] += 1  # 和条件无关的key
+        self.assertEqual(guard.update_count, 1)
+        self.assertEqual(other.update_count, 1)
+        self.assertEqual(root.status, Status.RUNNING)
+
+        context['agent'] = { 'x': 3 }
+        tree.tick()
+        self.assertEqual(guard.update_count, 2)
+        self.assertEqual(guard.status, Status.FAILURE)
+        self.assertEqual(root.status, Status.FAILURE)
+
+        context['hp'] = 0
+        tree.tick()
+        self.assertEqual(guard.update_count, 3)
+
+        # 原地修改嵌套对象需要touch
+        context['agent'] = { 'x': 12 }
+        context['hp'] = 1
+        tree.tick()
+        self.assertEqual(root.status, Status.RUNNING)
+        context['agent']['x'] = 0
+        tree.tick()
+        self.assertEqual(root.status, Status.RUNNING)
+        context.touch('agent')
+        tree.tick()
+        self.assertEqual(root.status, Status.FAILURE)
+
+    def test_plain_dict_not_tracked(self):
+        guard = CountedRule(rule='x > 0')
+        tree = Tree(root=guard, context={ 'x': 1 }).setup()
+        for _ in range(3):
+            tree.tick()
+        self.assertEqual(guard.update_count, 3)
+
+    def test_default_context_not_tracked(self):
+        guard = CountedRule(rule='{{agent["hp"]}} > 3')
+        tree = Tree(root=guard).setup()
+        self.assertNotIsInstance(tree.context, Context)
+        tree.context['agent'] = { 'hp': 5 }
+        tree.tick()
+        tree.context['agent']['hp'] = 1
+        tree.tick()
+        self.assertEqual(guard.status, Status.FAILURE)
+        self.assertEqual(guard.update_count, 2)
+
+    def test_random_rule_not_pure(self):
+        guard = CountedRule(rule='random.random() < 0.5')
+        tree = Tree(root=guard, context=Context()).setup()
+        self.assertFalse(guard.pure)
+        statuses = set()
+        for _ in range(30):
+            tree.tick()
+            statuses.add(guard.status)
+        self.assertEqual(guard.update_count, 30)
+        self.assertEqual(statuses, { Status.SUCCESS, Status.FAILURE })
+
+    def test_share_identical_conditions(self):
+        guards = [CountedRule(rule='{{hp}} > 0') for _ in range(3)]
+        other = CountedRule(rule='{{hp}} > 1')
+        root = Parallel(children=[
+            Selector(children=[guards[0], Failure()]),
+            Parallel(children=[guards[1], other, guards[2]]),
+        ])
+        context = Context(hp=5)
+        tree = Tree(root=root, context=context).setup()
+        tree.tick()
+        self.assertEqual(sum(guard.update_count for guard in guards), 1)
+        self.assertEqual(other.update_count, 1)
+        self.assertEqual([guard.status for guard in guards], [Status.SUCCESS] * 3)
+
+        context['hp'] = 0
+        tree.tick()
+        self.assertEqual(sum(guard.update_count for guard in guards), 2)
+        self.assertEqual([guard.status for guard in guards], [Status.FAILURE] * 3)
+        self.assertEqual(other.status, Status.FAILURE)
+
+    def test_name_in_pure_key(self):
+        # 表达式里用到了name时，名字不同的节点结果不同，不能共用
+        guards = [CountedRule(name=name, rule="name == 'a'") for name in ['a', 'b']]
+        same = [CountedRule(name=name, rule='{{hp}} > 0') for name in ['a', 'b']]
+        tree = Tree(root=Parallel(children=guards + same), context=Context(hp=5)).setup()
+        tree.tick()
+        self.assertEqual([guard.status for guard in guards], [Status.SUCCESS, Status.FAILURE])
+        self.assertEqual([guard.update_count for guard in guards], [1, 1])
+        self.assertEqual(sum(node.update_count for node in same), 1)
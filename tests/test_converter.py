@@ -0,0 +1,142 @@
+import unittest
+from pybts import *
+from pybts import converter
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def test_template_cache(self):
+        converter.cache_clear()
+        node = Print(msg='{{a}}-{{b}}')
+        tree = Tree(root=node, context={ 'a': 1, 'b': 'x' }).setup()
+        for _ in range(5):
+            self.assertEqual(node.converter.render(node.msg), '1-x')
+        info = converter.cache_info()['template']
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 4)
+        tree.context['a'] = 2
+        self.assertEqual(node.converter.render(node.msg), '2-x')
+
+    def test_expression_cache(self):
+        converter.cache_clear()
+        node = Success()
+        Tree(root=node, context={ 'x': 3 }).setup()
+        for _ in range(3):
+            self.assertEqual(node.converter.float('x * 2'), 6.0)
+        info = converter.cache_info()['expression']
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 2)
+
+    def test_rendered_not_cached(self):
+        converter.cache_clear()
+        node = Success()
+        tree = Tree(root=node, context={ 'items': [] }).setup()
+        binding = converter.Binding('{{ items | length }} > 2', 'bool')
+        for i in range(5):
+            tree.context['items'] = list(range(i))
+            self.assertEqual(binding(node.converter), i > 2)
+        # 渲染结果（0 > 2、1 > 2...）不进入表达式缓存
+        self.assertEqual(converter.cache_info()['expression']['currsize'], 0)
+
+
+class TestBinding(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(converter.Binding('1.5', 'float').kind, converter.Binding.CONSTANT)
+        self.assertEqual(converter.Binding('false', 'bool').value, False)
+        self.assertEqual(converter.Binding('hello', 'str').kind, converter.Binding.CONSTANT)
+        self.assertEqual(converter.Binding('{{a}}', 'str').kind, converter.Binding.TEMPLATE)
+        self.assertEqual(converter.Binding('a * 2', 'float').kind, converter.Binding.EXPRESSION)
+        self.assertEqual(converter.Binding('{{a}} * 2', 'float').kind, converter.Binding.EXPRESSION)
+
+    def test_setup_binds_attrs(self):
+        node = Throttle(duration='{{d}} * 2', children=[Success()])
+        root = Sequence(children=[node], reactive='true')
+        tree = Tree(root=root, context={ 'd': 1.5 }).setup()
+        self.assertEqual(node.bindings['duration'].kind, converter.Binding.EXPRESSION)
+        self.assertEqual(node.param('duration'), 3.0)
+        self.assertEqual(root.bindings['reactive'].kind, converter.Binding.CONSTANT)
+        self.assertTrue(root.reactive)
+        tree.context['d'] = 2
+        self.assertEqual(node.param('duration'), 4.0)
+
+    def test_setup_syntax_error(self):
+        with self.assertRaises(SyntaxError):
+            Tree(root=RandomSuccess(prob='0.5 +')).setup()
+        for rule in ['{{x}} >', '{{x}} > > 1', '{{ x | length }} >']:
+            with self.assertRaises(SyntaxError, msg=rule):
+                Tree(root=IsMatchRule(rule=rule), context={ 'x': 1 }).setup()
+        # 过滤器、相邻的占位符、jinja的控制结构在setup时不报错
+        for rule in ['{{ x | string | length }} > 0', '{{x}}{{x}} == 11', '{% if x %}{{x}}{% else %}0{% endif %}']:
+            node = IsMatchRule(rule=rule)
+            tree = Tree(root=node, context={ 'x': 1 }).setup()
+            tree.tick()
+            self.assertEqual(node.status, Status.SUCCESS, rule)
+
+
+class TestNativeExpression(unittest.TestCase):
+
+    def setUp(self):
+        self.node = Success()
+        self.tree = Tree(root=self.node, context={
+            'agent': { 'x': 12, 'name': 'red' },
+            'a'    : 1.5,
+            'items': [1, 2, 3],
+        }).setup()
+
+    def test_native_types(self):
+        c = self.node.converter
+        self.assertIs(c.evaluate('{{agent.x}} > 10'), True)
+        self.assertEqual(c.evaluate('{{a}} * 2'), 3.0)
+        self.assertEqual(c.evaluate('{{items}} + [4]'), [1, 2, 3, 4])
+        # 字符串和渲染时一样，需要自己加引号
+        self.assertIs(c.evaluate("'{{agent.name}}' == 'red'"), True)
+        self.assertIs(c.evaluate("'{{agent['name']}}' == 'red'"), True)
+        self.assertEqual(c.float('{{a}}*2'), 3.0)
+        self.assertEqual(c.int('{{agent.x}} // 5'), 2)
+
+    def test_fallback_to_render(self):
+        c = self.node.converter
+        # 过滤器是jinja专有语法，退回到先渲染再求值
+        self.assertEqual(c.evaluate('{{ items | length }} + 1'), 4)
+        self.assertEqual(converter.Binding('{{ items | length }} + 1', 'int')(c), 4)
+
+    def test_string_values_render(self):
+        # 字符串的值渲染之后会被当成表达式解析，和直接渲染再求值的结果一致
+        for value, status in [('0', Status.FAILURE), ('False', Status.FAILURE), ('3 > 5', Status.FAILURE),
+                              ('1', Status.SUCCESS), ('2 > 1', Status.SUCCESS)]:
+            node = IsMatchRule(rule='{{m}}')
+            tree = Tree(root=node, context={ 'm': value }).setup()
+            tree.tick()
+            self.assertEqual(node.status, status, value)
+
+    def test_same_as_render(self):
+        c = self.node.converter
+        self.tree.context.update(n=-2, b=3, one=1)
+        # 负数渲染成 -2，-2 ** 2 == -4
+        self.assertEqual(c.evaluate('{{n}} ** 2'), -4)
+        self.assertEqual(converter.Binding('{{n}} ** 2', 'float')(c), -4.0)
+        self.assertEqual(c.evaluate('{{a}} ** 2'), 2.25)
+        # 相邻的占位符渲染后拼成一个数
+        self.assertIsNone(converter.compile_native_expression('{{one}}{{b}}'))
+        self.assertEqual(c.evaluate('{{one}}{{b}}'), 13)
+        self.assertEqual(converter.Binding('{{one}}{{b}} + 1', 'int')(c), 14)
+        self.assertIsNone(converter.compile_native_expression("'{{b}}' == '3'"))
+        self.assertIs(c.evaluate("'{{b}}' == '3'"), True)
+
+    def test_errors_not_swallowed(self):
+        c = self.node.converter
+        with self.assertRaises(ZeroDivisionError):
+            c.evaluate('{{a}} / 0')
+        with self.assertRaises(NameError):
+            c.evaluate('{{agent.name}} > 10')
+
+    def test_is_match_rule(self):
+        node = IsMatchRule(rule='{{agent.x}} > 10')
+        tree = Tree(root=node, context={ 'agent': { 'x': 12 } }).setup()
+        self.assertTrue(node.bindings['rule'].native)
+        tree.tick()
+        self.assertEqual(node.status, Status.SUCCESS)
+        tree.context['agent']['x'] = 3
+        tree.tick()
+        self.assertEqual(node.status, Status.FAILURE)
@@ -97,3 +97,44 @@ class TestIsStatusChanged(unittest.TestCase):
 
 
 
+
+
+class TestLazyResetDecorators(unittest.TestCase):
+
+    class CountedSuccess(Node):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.update_count = 0
+
+        def update(self) -> Status:
+            self.update_count += 1
+            return Status.SUCCESS
+
+    def test_one_shot_after_reset(self):
+        child = self.CountedSuccess()
+        one_shot = OneShot(children=[child])
+        tree = Tree(root=Sequence(children=[one_shot])).setup()
+        tree.tick()
+        tree.tick()
+        self.assertEqual(child.update_count, 1)
+        self.assertEqual(one_shot.final_status, Status.SUCCESS)
+        # 新的一轮第一次tick时先reset再判断，子节点重新执行一次
+        tree.reset()
+        tree.tick()
+        self.assertEqual(child.update_count, 2)
+        self.assertEqual(one_shot.status, Status.SUCCESS)
+        tree.tick()
+        self.assertEqual(child.update_count, 2)
+
+    def test_throttle_after_reset(self):
+        child = self.CountedSuccess()
+        throttle = Throttle(duration=10, time='{{t}}', children=[child])
+        tree = Tree(root=Sequence(children=[throttle]), context={ 't': 0 }).setup()
+        tree.tick()
+        tree.context['t'] = 1
+        tree.tick()
+        self.assertEqual(child.update_count, 1)
+        tree.reset()
+        tree.context['t'] = 2
+        tree.tick()
+        self.assertEqual(child.update_count, 2)
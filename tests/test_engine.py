@@ -0,0 +1,185 @@
+import unittest
+from pybts import *
+from pybts.engine import FlatEngine, OPCODE
+from tests.test_composites import ToggleStatus
+
+S, F, R = Status.SUCCESS, Status.FAILURE, Status.RUNNING
+
+
+def build_root():
+    return Parallel(children=[
+        Sequence(children=[
+            ToggleStatus(status_list=[S, S, F]),
+            ToggleStatus(status_list=[R, S, F, R]),
+            Selector(children=[
+                ToggleStatus(status_list=[F, R, S]),
+                Inverter(children=[ToggleStatus(status_list=[S, F, R])]),
+            ]),
+        ]),
+        SelectorWithMemory(children=[
+            ToggleStatus(status_list=[F, F, S]),
+            ToggleStatus(status_list=[R, R, F, S]),
+        ]),
+        ReactiveSequence(children=[
+            ToggleStatus(status_list=[S, F]),
+            ToggleStatus(status_list=[R, R, S]),
+        ]),
+        CondBranch(children=[
+            ToggleStatus(status_list=[S, F, R, S, F]),
+            ToggleStatus(status_list=[R, S]),
+            ToggleStatus(status_list=[F, R]),
+        ]),
+        Switcher(index='{{round}}', children=[
+            ToggleStatus(status_list=[R, S]),
+            ToggleStatus(status_list=[F]),
+        ]),
+        OneShot(children=[ToggleStatus(status_list=[R, S])]),
+    ], success_threshold=-1)
+
+
+class TestFlatEngine(unittest.TestCase):
+
+    def test_compile(self):
+        root = build_root()
+        tree = Tree(root=root).setup(engine='flat')
+        engine: FlatEngine = tree.engine
+        self.assertEqual(len(engine), len(list(root.iterate())))
+        self.assertEqual(engine.nodes[0], root)
+        self.assertEqual(engine.opcodes[0], OPCODE.PARALLEL)
+        for i, node in enumerate(engine.nodes):
+            children = engine.nodes[engine.child_start[i]:engine.child_end[i]]
+            self.assertEqual(children, node.children)
+            for child_index in range(engine.child_start[i], engine.child_end[i]):
+                self.assertEqual(engine.parent[child_index], i)
+        # OneShot重写了tick，退化为GENERIC
+        self.assertEqual(engine.opcodes[engine.index_of[id(root.children[-1])]], OPCODE.GENERIC)
+
+    def test_same_status_as_generator(self):
+        generator_tree = Tree(root=build_root()).setup()
+        flat_tree = Tree(root=build_root()).setup(engine='flat')
+
+        for i in range(30):
+            if i == 15:
+                generator_tree.reset()
+                flat_tree.reset()
+            generator_tree.tick()
+            flat_tree.tick()
+            expected = [node.status for node in generator_tree.root.iterate()]
+            actual = [node.status for node in flat_tree.root.iterate()]
+            self.assertEqual(expected, actual, f'tick {i}')
+
+        self.assertEqual(generator_tree.count, flat_tree.count)
+
+
+class TestLeanMode(unittest.TestCase):
+
+    def test_same_status_as_debug(self):
+        debug_tree = Tree(root=build_root()).setup()
+        lean_tree = Tree(root=build_root()).setup(engine='flat', mode='lean')
+        for i in range(20):
+            debug_tree.tick()
+            lean_tree.tick()
+            expected = [node.status for node in debug_tree.root.iterate()]
+            actual = [node.status for node in lean_tree.root.iterate()]
+            self.assertEqual(expected, actual, f'tick {i}')
+
+        self.assertGreater(debug_tree.root.debug_info['tick_count'], 0)
+        for node in lean_tree.root.iterate():
+            self.assertFalse(node.debug)
+            self.assertEqual(sum(node.debug_info.values()), 0)
+
+
+def build_deep_root(seed: int):
+    """以记忆/非reactive组合节点为主的随机树，用来覆盖运行前沿"""
+    import random
+    rng = random.Random(seed)
+
+    def leaf():
+        return ToggleStatus(status_list=[rng.choice([S, F, R, R]) for _ in range(rng.randint(1, 5))])
+
+    def build(depth):
+        if depth == 0:
+            return leaf()
+        kind = rng.choice(['seq', 'sel', 'seq_mem', 'sel_mem', 'cond', 'switch', 'inverter', 'leaf'])
+        if kind == 'leaf':
+            return leaf()
+        if kind == 'inverter':
+            return Inverter(children=[build(depth - 1)])
+        if kind == 'cond':
+            return CondBranch(children=[build(depth - 1) for _ in range(rng.randint(2, 3))], memory=rng.random() < 0.5)
+        if kind == 'switch':
+            return Switcher(index='{{round}}', children=[build(depth - 1) for _ in range(2)])
+        children = [build(depth - 1) for _ in range(rng.randint(1, 3))]
+        return {
+            'seq'    : Sequence,
+            'sel'    : Selector,
+            'seq_mem': SequenceWithMemory,
+            'sel_mem': SelectorWithMemory,
+        }[kind](children=children)
+
+    return Sequence(children=[build(5), build(5)])
+
+
+class TestRunningFrontier(unittest.TestCase):
+
+    def test_same_status_as_generator(self):
+        resumed = 0
+        for seed in range(20):
+            generator_tree = Tree(root=build_deep_root(seed)).setup()
+            flat_tree = Tree(root=build_deep_root(seed)).setup(engine='flat')
+            for i in range(40):
+                if i == 25:
+                    generator_tree.reset()
+                    flat_tree.reset()
+                if flat_tree.engine.frontier is not None:
+                    resumed += 1
+                generator_tree.tick()
+                flat_tree.tick()
+                expected = [node.status for node in generator_tree.root.iterate()]
+                actual = [node.status for node in flat_tree.root.iterate()]
+                self.assertEqual(expected, actual, f'seed {seed} tick {i}')
+                expected = [node.debug_info['tick_count'] for node in generator_tree.root.iterate()]
+                actual = [node.debug_info['tick_count'] for node in flat_tree.root.iterate()]
+                self.assertEqual(expected, actual, f'seed {seed} tick {i}')
+        self.assertGreater(resumed, 0)
+
+
+class TestTickBudget(unittest.TestCase):
+
+    def test_preempt_and_resume(self):
+        for engine in ['generator', 'flat']:
+            tree = Tree(root=build_root()).setup(engine=engine)
+            budget_tree = Tree(root=build_root()).setup(engine=engine)
+            for _ in range(12):
+                tree.tick()
+                calls = 1
+                while not budget_tree.tick(budget_ms=0):
+                    # 每次只执行一个节点，暂停时还是上一帧的计数
+                    self.assertTrue(budget_tree.preempted)
+                    self.assertIsNotNone(budget_tree.last_ticked)
+                    self.assertEqual(budget_tree.count, tree.count - 1)
+                    calls += 1
+                self.assertGreater(calls, 1)
+                self.assertFalse(budget_tree.preempted)
+                self.assertEqual(budget_tree.count, tree.count)
+                self.assertEqual([node.status for node in budget_tree.root.iterate()],
+                                 [node.status for node in tree.root.iterate()], engine)
+
+    def test_reset_drops_pending_tick(self):
+        tree = Tree(root=Sequence(children=[Success(), Running()])).setup()
+        self.assertFalse(tree.tick(budget_ms=0))
+        tree.reset()
+        self.assertFalse(tree.preempted)
+        self.assertTrue(tree.tick())
+        self.assertEqual(tree.root.status, Status.RUNNING)
+        self.assertEqual(tree.count, 1)
+
+    def test_reset_stops_running_nodes(self):
+        # 第一帧执行到一半被暂停，根节点还是INVALID，但第一个子节点已经RUNNING
+        running = Running()
+        tree = Tree(root=Parallel(children=[running, Success()])).setup()
+        self.assertFalse(tree.tick(budget_ms=0))
+        self.assertEqual(tree.root.status, Status.INVALID)
+        self.assertEqual(running.status, Status.RUNNING)
+        tree.reset()
+        self.assertEqual(running.status, Status.INVALID)
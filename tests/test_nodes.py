@@ -1,4 +1,8 @@
+import asyncio
+import concurrent.futures
 import logging
+import math
+import time
 import unittest
 from pybts import *
 
@@ -111,3 +115,300 @@ class TestUpdater(unittest.TestCase):
         tree.tick()
         self.assertEqual(Status.FAILURE, node1.status)
         self.assertEqual(Status.FAILURE, node2.status)
+
+
+class TestLazyAttrs(unittest.TestCase):
+
+    def test_lazy_attrs(self):
+        node = Print(msg='hello')
+        other = Print(msg='hello')
+        self.assertNotEqual(node.serial, other.serial)
+        for key in ['id', 'logger', 'iterator', 'debug_info', 'actions']:
+            self.assertNotIn(key, node.__dict__)
+
+        self.assertEqual(node.id, node.id)
+        self.assertNotEqual(node.id, other.id)
+        self.assertEqual(node.to_data()['actions'], [])
+        self.assertNotIn('actions', node.__dict__)
+        node.actions.put('a')
+        self.assertEqual(node.to_data()['actions'], ['a'])
+
+        with self.assertRaises(AttributeError):
+            _ = node.unknown_attr
+
+        tree = Tree(root=Sequence(children=[node])).setup()
+        tree.tick()
+        self.assertEqual(node.debug_info['tick_count'], 1)
+        tree.reset()
+        self.assertEqual(node.debug_info['tick_count'], 0)
+
+
+class TestCounterTable(unittest.TestCase):
+
+    def test_counters(self):
+        success, failure = Success(), Failure()
+        root = Sequence(children=[success, failure])
+        tree = Tree(root=root).setup()
+        for _ in range(3):
+            tree.tick()
+
+        self.assertEqual(tree.counters.data.shape, (3, len(COUNTER_KEYS)))
+        self.assertEqual(root.debug_info['tick_count'], 3)
+        self.assertEqual(root.debug_info['failure_count'], 3)
+        self.assertEqual(tree.counters.row(success), success.debug_info)
+        self.assertEqual(success.to_data()['debug_info']['success_count'], 3)
+        self.assertEqual(tree.counters.totals()['tick_count'], 9)
+        # 节点的计数是计数表中的一行
+        tree.counters.data[tree.counters.index_of[id(failure)], COUNTER.TICK] = 100
+        self.assertEqual(failure.debug_info['tick_count'], 100)
+
+        tree.reset()
+        self.assertEqual(tree.counters.totals()['tick_count'], 0)
+        self.assertEqual(len(tree.counters.to_json()['counters']), 3)
+        self.assertEqual(tree.counters.to_json()['serials'], [node.serial for node in tree.root.iterate()])
+        self.assertNotIn('id', success.__dict__)
+
+    def test_lean_reset(self):
+        success = Success()
+        tree = Tree(root=Sequence(children=[success])).setup(mode='lean')
+        tree.tick()
+        tree.reset(lazy=False)
+        # lean模式下reset不会创建计数
+        self.assertNotIn('counters', success.__dict__)
+        success.debug_info = { 'tick_count': 3 }
+        self.assertEqual(success.debug_info['tick_count'], 3)
+        self.assertEqual(success.debug_info['success_count'], 0)
+
+
+class TestLazyReset(unittest.TestCase):
+
+    def test_reset_on_first_tick(self):
+        for engine in ['generator', 'flat']:
+            idle = IsChanged(value='{{value}}')
+            running = Running()
+            root = Selector(children=[Failure(), running, idle])
+            tree = Tree(root=root, context={ 'value': 1 }).setup(engine=engine)
+            tree.tick()
+            self.assertEqual(running.status, Status.RUNNING)
+
+            tree.reset()
+            # 运行中的节点马上被停止，但只有根节点执行了reset
+            self.assertEqual(tree.epoch, 1)
+            self.assertEqual(running.status, Status.INVALID)
+            self.assertEqual((root.reset_count, running.reset_count, idle.reset_count), (1, 0, 0))
+
+            tree.tick()
+            self.assertEqual(running.reset_count, 1, engine)
+            self.assertEqual(idle.reset_count, 0)  # 没有执行到的节点不会reset
+            tree.tick()
+            self.assertEqual(running.reset_count, 1)
+
+            tree.reset(lazy=False)
+            # idle在上一轮没有被执行到，reset次数也要算上
+            self.assertEqual((root.reset_count, running.reset_count, idle.reset_count), (2, 2, 2))
+            tree.tick()
+            self.assertEqual(running.reset_count, 2)
+
+    def test_eager_node(self):
+        class EagerNode(Success):
+            lazy_reset = False
+
+        node = EagerNode()
+        tree = Tree(root=Sequence(children=[Failure(), node])).setup()
+        tree.reset()
+        self.assertEqual(node.reset_count, 1)
+
+    def test_overridden_tick_reset_eagerly(self):
+        class CustomTick(Node):
+            # 重写了tick，没有经过leaf_tick等公共逻辑
+            def tick(self):
+                self.status = Status.SUCCESS
+                yield self
+
+        custom = CustomTick()
+        tree = Tree(root=Sequence(children=[custom])).setup()
+        tree.tick()
+        self.assertEqual(custom.status, Status.SUCCESS)
+        tree.reset()
+        self.assertEqual(custom.reset_count, 1)
+        self.assertEqual(custom.status, Status.INVALID)
+
+    def test_to_data_after_reset(self):
+        idle = IsChanged(value='{{value}}')
+        tree = Tree(root=Selector(children=[IsMatchRule(rule='{{skip}}'), idle]),
+                    context={ 'value': 1, 'skip': False }).setup()
+        tree.tick()
+        self.assertEqual(idle.status, Status.FAILURE)
+        tree.context['skip'] = True
+        tree.reset()
+        tree.tick()
+        tree.reset()
+        # 没有被执行到的节点在board上查看时先reset，reset次数包括中间没有执行到的几轮
+        self.assertEqual(idle.to_data()['reset_count'], 2)
+        self.assertEqual(idle.status, Status.INVALID)
+
+
+class TestPriority(unittest.TestCase):
+
+    def test_shed_below(self):
+        builder = Builder()
+        for engine in ['generator', 'flat']:
+            root = builder.build_from_xml(xml_data='''
+            <Parallel>
+                <Sequence priority="-1" shed_status="success">
+                    <Running/>
+                </Sequence>
+                <Running priority="0"/>
+                <Running/>
+            </Parallel>
+            ''')
+            tree = Tree(root=root).setup(engine=engine)
+            cosmetic, important, plain = root.children
+            self.assertNotIn('tick', cosmetic.__dict__)  # 优先级在类的tick中判断，实例上没有替换的方法
+            tree.tick()
+            self.assertEqual(cosmetic.status, Status.RUNNING)
+
+            tree.shed_below = 0
+            tree.tick()
+            self.assertEqual(cosmetic.status, Status.SUCCESS, engine)
+            self.assertEqual(cosmetic.children[0].status, Status.INVALID)  # 运行中的子树被停止
+            self.assertEqual(important.status, Status.RUNNING)
+            self.assertEqual(cosmetic.to_data()['shed_count'], 1)
+            self.assertEqual(important.to_data()['shed_count'], 0)
+            self.assertNotIn('shed_count', plain.to_data())
+
+            tree.shed_below = 1
+            tree.tick()
+            self.assertEqual(important.status, Status.FAILURE)
+            self.assertEqual(plain.status, Status.RUNNING)  # 没有优先级的节点不会被跳过
+
+            tree.shed_below = -math.inf
+            tree.tick()
+            self.assertEqual(cosmetic.status, Status.RUNNING)
+            self.assertEqual(cosmetic.shed_count, 2)
+
+    def test_shed_near_deadline(self):
+        cosmetic = Success(priority=-1)
+        normal = Success(priority=0)
+        tree = Tree(root=Sequence(children=[normal, cosmetic])).setup()
+        while not tree.tick(budget_ms=0):
+            pass
+        self.assertEqual((normal.shed_count, cosmetic.shed_count), (0, 1))
+        self.assertEqual(tree.root.status, Status.FAILURE)
+        tree.tick()
+        self.assertEqual(cosmetic.shed_count, 1)
+        self.assertEqual(tree.root.status, Status.SUCCESS)
+
+
+class Sleep(AsyncAction):
+
+    def __init__(self, seconds: float, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+
+    async def async_update(self) -> Status:
+        await asyncio.sleep(self.seconds)
+        return Status.SUCCESS
+
+
+class TestAsyncAction(unittest.TestCase):
+
+    def test_overlap_trees(self):
+        trees = [Tree(root=Sleep(seconds=0.05)).setup() for _ in range(50)]
+
+        async def main():
+            return await asyncio.gather(*(
+                tree.run_async(hz=200, until=lambda tree: tree.root.status == Status.SUCCESS) for tree in trees))
+
+        start = time.perf_counter()
+        stats = asyncio.run(main())
+        # 50个0.05秒的任务在同一个线程里重叠执行
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertTrue(all(tree.root.status == Status.SUCCESS for tree in trees))
+        self.assertTrue(all(item.ticks >= 2 for item in stats))
+
+    def test_cancel_on_reset(self):
+        node = Sleep(seconds=10)
+        tree = Tree(root=node).setup()
+
+        async def main():
+            await tree.tick_async()
+            task = node.task
+            self.assertEqual(node.status, Status.RUNNING)
+            tree.reset()
+            await asyncio.sleep(0)
+            return task
+
+        task = asyncio.run(main())
+        self.assertTrue(task.cancelled())
+        self.assertIsNone(node.task)
+
+    def test_abstract_async_update(self):
+        class NoUpdate(AsyncAction):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoUpdate()
+
+    def test_needs_event_loop(self):
+        tree = Tree(root=Sleep(seconds=0)).setup()
+        with self.assertRaises(Exception):
+            tree.tick()
+
+
+class SlowSquare(FutureAction):
+
+    @staticmethod
+    def compute(x: int, seconds: float) -> int:
+        time.sleep(seconds)
+        return x * x
+
+    def compute_args(self) -> tuple:
+        return self.context['x'], self.context['seconds']
+
+    def on_result(self, result: int) -> Status:
+        self.context['result'] = result
+        return Status.SUCCESS
+
+
+class TestFutureAction(unittest.TestCase):
+
+    def test_poll_future(self):
+        node = SlowSquare()
+        tree = Tree(root=node, context={ 'x': 7, 'seconds': 0.05 }).setup()
+        tree.tick()
+        self.assertEqual(node.status, Status.RUNNING)
+        while node.status == Status.RUNNING:
+            time.sleep(0.01)
+            tree.tick()
+        self.assertEqual(node.status, Status.SUCCESS)
+        self.assertEqual(tree.context['result'], 49)
+        self.assertIsNone(node.future)
+
+    def test_cancel_on_interrupt(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            blocker = executor.submit(time.sleep, 0.2)  # 占住唯一的线程，后面提交的future还没开始执行
+            node = SlowSquare(executor=executor)
+            tree = Tree(root=node, context={ 'x': 2, 'seconds': 0 }).setup()
+            tree.tick()
+            future = node.future
+            node.stop(Status.INVALID)
+            self.assertTrue(future.cancelled())
+            self.assertIsNone(node.future)
+            blocker.cancel()
+
+    def test_update_count(self):
+        node = SlowSquare()
+        tree = Tree(root=node, context={ 'x': 3, 'seconds': 0 }).setup()
+        tree.tick()
+        while node.status == Status.RUNNING:
+            time.sleep(0.01)
+            tree.tick()
+        self.assertEqual(node.debug_info['update_count'], node.debug_info['tick_count'])
+
+    def test_abstract_compute(self):
+        class NoCompute(FutureAction):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoCompute()
@@ -0,0 +1,57 @@
+import unittest
+from pybts import *
+from pybts.prototype import TreePrototype
+from tests.test_engine import build_root
+from tests.test_snapshot import trace
+
+
+def build_agent():
+    return Parallel(children=[
+        build_root(),
+        IsChanged(value='{{step // 2}}'),
+        IsMatchRule(rule='{{step}} > 3', priority=1),
+    ])
+
+
+class TestTreePrototype(unittest.TestCase):
+
+    def test_instances_match_built_tree(self):
+        for engine in ['generator', 'flat']:
+            expected = trace(Tree(root=build_agent(), context=Context(step=0)).setup(engine=engine), 8)
+            prototype = TreePrototype(build_agent(), engine=engine)
+            first = prototype.instantiate(context=Context(step=0))
+            second = prototype.instantiate(context=Context(step=0))
+            self.assertEqual(first.engine is None, engine == 'generator')
+            self.assertEqual(trace(first, 8), expected, engine)
+            self.assertEqual(second.count, 0)
+            self.assertTrue(all(node.status == Status.INVALID for node in second.nodes))
+            self.assertEqual(trace(second, 8), expected, engine)
+            self.assertTrue((first.counters.data == second.counters.data).all())
+
+    def test_share_definition(self):
+        prototype = TreePrototype(build_agent())
+        first = prototype.instantiate()
+        second = prototype.instantiate()
+        self.assertEqual(len(first.nodes), len(prototype.tree.nodes))
+        for template, a, b in zip(prototype.tree.nodes, first.nodes, second.nodes):
+            self.assertIsNot(a, b)
+            self.assertIs(a.attrs, b.attrs)
+            self.assertIs(a.bindings, template.bindings)
+            self.assertIs(a.context, first.context)
+            self.assertIs(b.context, second.context)
+            for child_a, child_b in zip(a.children, b.children):
+                self.assertIs(child_a.parent, a)
+                self.assertIs(child_b.parent, b)
+
+    def test_lazy_binding_not_shared(self):
+        prototype = TreePrototype(build_agent())
+        first = prototype.instantiate()
+        second = prototype.instantiate()
+        template = prototype.root
+        self.assertNotIn('label', template.bindings)
+        self.assertEqual(first.root.label, first.root.name)
+        # 第一次读取新的参数时复制自己的bindings，共用的定义不变
+        self.assertIn('label', first.root.bindings)
+        self.assertIsNot(first.root.bindings, template.bindings)
+        self.assertNotIn('label', template.bindings)
+        self.assertIs(second.root.bindings, template.bindings)
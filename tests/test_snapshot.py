@@ -0,0 +1,109 @@
+import pickle
+import unittest
+from pybts import *
+from tests.test_engine import build_root
+
+
+def trace(tree, ticks):
+    result = []
+    for _ in range(ticks):
+        tree.context['step'] += 1
+        tree.tick()
+        result.append([node.status for node in tree.nodes])
+    return result
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_restore_replays(self):
+        for engine in ['generator', 'flat']:
+            root = Parallel(children=[
+                build_root(),
+                IsChanged(value='{{step // 2}}'),
+                TimeElapsed(duration=3, time='{{step}}'),
+            ])
+            tree = Tree(root=root, context=Context(step=0)).setup(engine=engine)
+            trace(tree, 5)
+            snapshot = tree.snapshot()
+            expected = trace(tree, 7)
+            counters = tree.counters.data.copy()
+
+            for _ in range(2):
+                tree.restore(snapshot)
+                self.assertEqual(tree.count, 5)
+                self.assertEqual(tree.context['step'], 5)
+                self.assertEqual(trace(tree, 7), expected, engine)
+                self.assertTrue((tree.counters.data == counters).all())
+
+    def test_restore_commutative(self):
+        for engine in ['generator', 'flat']:
+            root = Sequence(commutative=True, reorder_interval=5, children=[
+                Success(name='pass'), Success(name='pass2'), Failure(name='fail'),
+            ])
+            tree = Tree(root=root, context=Context(step=0)).setup(engine=engine)
+            trace(tree, 3)
+            snapshot = tree.snapshot()
+            order = [child.name for child in root.children]
+            stats = root.to_data()['child_stats']
+            expected = trace(tree, 12)
+            self.assertNotEqual([child.name for child in root.children], order)  # 快照之后重新排列过
+
+            for _ in range(2):
+                tree.restore(snapshot)
+                self.assertEqual([child.name for child in root.children], order, engine)
+                self.assertEqual(root.to_data()['child_stats'], stats)
+                self.assertEqual(trace(tree, 12), expected, engine)
+
+    def test_fork(self):
+        changed = IsChanged(value='{{x}}')
+        tree = Tree(root=changed, context=Context(x=1)).setup()
+        tree.tick()
+        with tree.fork():
+            tree.context['x'] = 2
+            tree.context['tmp'] = 1
+            tree.tick()
+            self.assertEqual(changed.last_value, '2')
+        self.assertEqual(changed.last_value, '1')
+        self.assertEqual(tree.context['x'], 1)
+        self.assertNotIn('tmp', tree.context)
+        self.assertEqual(tree.count, 1)
+        tree.tick()
+        self.assertEqual(changed.status, Status.FAILURE)
+
+    def test_snapshot_other_tree(self):
+        tree = Tree(root=Success()).setup()
+        other = Tree(root=Success()).setup()
+        with self.assertRaises(AssertionError):
+            other.restore(tree.snapshot())
+
+
+class TestPickle(unittest.TestCase):
+
+    def test_pickle_tree(self):
+        for engine in ['generator', 'flat']:
+            root = Parallel(children=[
+                build_root(),
+                IsChanged(value='{{step // 2}}'),
+                IsMatchRule(rule='{{step}} > 3', priority=1),
+            ])
+            tree = Tree(root=root, context=Context(step=0)).setup(engine=engine)
+            trace(tree, 3)
+            root.children[0].children[0].children[0].logger.debug('create the lazy logger')
+            copied = pickle.loads(pickle.dumps(tree))
+
+            self.assertEqual(copied.count, 3)
+            self.assertEqual(copied.engine is None, engine == 'generator')
+            self.assertEqual([node.status for node in copied.nodes], [node.status for node in tree.nodes])
+            self.assertTrue((copied.counters.data == tree.counters.data).all())
+            self.assertIs(copied.nodes[1].counters.base, copied.counters.data)
+            self.assertEqual(trace(copied, 6), trace(tree, 6), engine)
+            self.assertTrue((copied.counters.data == tree.counters.data).all())
+
+    def test_pickle_actions(self):
+        action = Print(msg='hello')
+        action.actions.put_nowait('fire')
+        tree = Tree(root=action).setup()
+        tree.tick()
+        copied = pickle.loads(pickle.dumps(tree)).root
+        self.assertEqual(copied.actions.get_nowait(), 'fire')
+        self.assertEqual(action.actions.qsize(), 1)